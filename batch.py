@@ -0,0 +1,141 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .compressed_io import EXTENSIONS, GZIP, ZSTD, compression_of, strip_compression_suffix
+
+# Headless CSV -> point layer -> CSV runs over many files, spread over a
+# process pool. Run it with the Python interpreter QGIS uses, from the folder
+# that contains the plugin:
+#
+#   python -m editable_csv.batch data/*.csv --output-dir out --workers 8
+#
+# and use --json for a machine-readable report.
+
+KEEP_COMPRESSION = "keep"
+COMPRESSION_CHOICES = {"keep": KEEP_COMPRESSION, "none": None, "gzip": GZIP, "zstd": ZSTD}
+
+_qgs_app = None
+
+
+def _start_qgis():
+    # One QgsApplication per worker process, without a GUI
+    global _qgs_app
+    if _qgs_app is None:
+        from qgis.core import QgsApplication
+        _qgs_app = QgsApplication([], False)
+        _qgs_app.initQgis()
+
+
+def _convert(file_path, out_path, where, chunk_size, encoding):
+    from . import core
+    from .instrumentation import Operation
+
+    _start_qgis()
+    operation = Operation("convert", file_path)
+    try:
+        result = core.convert_file(file_path, out_path, where=where, chunk_size=chunk_size, operation=operation, encoding=encoding)
+    except Exception as e:
+        operation.finish("failed", str(e))
+        raise
+    result["phases"] = operation.finish()["phases"]
+    return result
+
+
+def output_path(file_path, output_dir, suffix, compression=KEEP_COMPRESSION):
+    # `compression` is GZIP, ZSTD, None for plain CSV, or KEEP_COMPRESSION to
+    # compress the output like the input
+    if compression == KEEP_COMPRESSION:
+        compression = compression_of(file_path)
+    name, extension = os.path.splitext(os.path.basename(strip_compression_suffix(file_path)))
+    return os.path.join(output_dir, f"{name}{suffix}{extension}{EXTENSIONS.get(compression, '')}")
+
+
+def run(file_paths, output_dir, workers=None, where=None, chunk_size=None, suffix="", on_result=None,
+        compression=KEEP_COMPRESSION, encoding="utf-8"):
+    # Converts every file and returns a report dict with the per-file results,
+    # the failures and the overall throughput. `on_result` is called with each
+    # result or failure as soon as it is known. Files are read and written
+    # with `encoding`.
+    os.makedirs(output_dir, exist_ok=True)
+    results = []
+    failures = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_convert, file_path, output_path(file_path, output_dir, suffix, compression), where, chunk_size, encoding): file_path
+                   for file_path in file_paths}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"file": futures[future], "error": str(e)}
+                failures.append(result)
+            else:
+                results.append(result)
+            if on_result is not None:
+                on_result(result)
+    elapsed = time.perf_counter() - start
+
+    rows = sum(result["rows_read"] for result in results)
+    bytes_read = sum(result["bytes_read"] for result in results)
+    bytes_written = sum(result["bytes_written"] for result in results)
+    seconds = max(elapsed, 1e-9)
+    return {
+        "files": len(results),
+        "failed": len(failures),
+        "rows": rows,
+        "bytes_read": bytes_read,
+        "bytes_written": bytes_written,
+        "seconds": elapsed,
+        "files_per_second": len(results) / seconds,
+        "rows_per_second": rows / seconds,
+        "bytes_per_second": (bytes_read + bytes_written) / seconds,
+        "results": results,
+        "failures": failures,
+    }
+
+
+def _print_result(result):
+    if "error" in result:
+        print(f"FAILED {result['file']}: {result['error']}", file=sys.stderr)
+    else:
+        print(f"{result['file']} -> {result['output']}: {result['rows_written']} of {result['rows_read']} rows")
+
+
+def _print_report(report):
+    print(f"{report['files']} file(s), {report['failed']} failed, {report['rows']:,} rows, "
+          f"{(report['bytes_read'] + report['bytes_written']) / (1024 * 1024):,.1f} MiB in {report['seconds']:.2f}s")
+    print(f"{report['files_per_second']:,.2f} files/s, {report['rows_per_second']:,.0f} rows/s, "
+          f"{report['bytes_per_second'] / (1024 * 1024):,.1f} MiB/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import CSV files as point layers and write them back out, without the QGIS GUI.")
+    parser.add_argument("files", nargs="+", help="CSV files to process")
+    parser.add_argument("--output-dir", required=True, help="Folder the processed files are written to")
+    parser.add_argument("--suffix", default="", help="Added to the name of each output file")
+    parser.add_argument("--where", help="QGIS expression; only matching rows are written")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument("--chunk-size", type=int, help="Features added per batch (default: the import_chunk_size setting)")
+    parser.add_argument("--compression", choices=sorted(COMPRESSION_CHOICES), default="keep",
+                        help="Compression of the output files; 'keep' matches each input file")
+    parser.add_argument("--encoding", default="utf-8", help="Encoding of the input and output files")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = run(args.files, args.output_dir, max(1, args.workers), args.where, args.chunk_size, args.suffix,
+                 on_result=None if args.json else _print_result,
+                 compression=COMPRESSION_CHOICES[args.compression], encoding=args.encoding)
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        _print_report(report)
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
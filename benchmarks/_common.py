@@ -0,0 +1,66 @@
+import importlib
+import os
+import random
+import sys
+import tempfile
+from contextlib import contextmanager
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_qgs_app = None
+
+
+def start_qgis():
+    global _qgs_app
+    if _qgs_app is None:
+        from qgis.core import QgsApplication
+        _qgs_app = QgsApplication([], False)
+        _qgs_app.initQgis()
+    return _qgs_app
+
+
+def load_plugin_module(name):
+    # The plugin is a package named after its folder, so import it that way
+    # to keep the relative imports inside it working.
+    parent, package = os.path.split(PLUGIN_DIR)
+    if parent not in sys.path:
+        sys.path.insert(0, parent)
+    return importlib.import_module(f"{package}.{name}")
+
+
+@contextmanager
+def plugin_settings(**values):
+    # Sets editable_csv/* settings for the duration of the block and puts
+    # back what was there before, so benchmarks leave the QGIS profile as
+    # they found it.
+    from qgis.core import QgsSettings
+    prefix = load_plugin_module("settings").SETTINGS_PREFIX
+    qgs_settings = QgsSettings()
+    previous = {}
+    for key, value in values.items():
+        full_key = f"{prefix}/{key}"
+        previous[full_key] = qgs_settings.value(full_key) if qgs_settings.contains(full_key) else None
+        qgs_settings.setValue(full_key, value)
+    try:
+        yield
+    finally:
+        for full_key, value in previous.items():
+            if value is None:
+                qgs_settings.remove(full_key)
+            else:
+                qgs_settings.setValue(full_key, value)
+
+
+def write_point_csv(rows, extra_columns=4, delimiter=",", path=None):
+    if path is None:
+        fd, path = tempfile.mkstemp(suffix=".csv")
+        os.close(fd)
+    rng = random.Random(rows)
+    header = ["x", "y"] + [f"col{i}" for i in range(extra_columns)]
+    with open(path, "w", newline="") as f:
+        f.write(delimiter.join(header) + "\n")
+        for i in range(rows):
+            values = [f"{rng.uniform(-180, 180):.6f}", f"{rng.uniform(-90, 90):.6f}"]
+            values += [f"v{i}_{c}" for c in range(extra_columns)]
+            f.write(delimiter.join(values) + "\n")
+    return path
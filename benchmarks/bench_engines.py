@@ -0,0 +1,54 @@
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from _common import load_plugin_module, start_qgis, write_point_csv
+
+
+def run_engine(path, engine, chunk_size):
+    from qgis.core import QgsVectorLayer
+    start_qgis()
+    csv_reader = load_plugin_module("csv_reader")
+
+    start = time.perf_counter()
+    reader = csv_reader.open_reader(path, ",", "x", "y", "no", engine=engine)
+    mem_layer = QgsVectorLayer(f"Point?crs={reader.crs()}", "bench", "memory")
+    mem_layer.dataProvider().addAttributes(reader.fields())
+    mem_layer.updateFields()
+    count = csv_reader.copy_features(reader, mem_layer.dataProvider(), chunk_size)
+    elapsed = time.perf_counter() - start
+
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mib = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    print(f"{engine:9s} {count} rows in {elapsed:.2f}s ({count / elapsed:,.0f} rows/s), peak RSS {peak_mib:,.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare wall time and peak memory of the import engines.")
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--columns", type=int, default=4)
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--engine", help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.engine:
+        run_engine(args.path, args.engine, args.chunk_size)
+        return
+
+    path = write_point_csv(args.rows, args.columns)
+    try:
+        # Each engine runs in its own process so the peak RSS figures are independent
+        for engine in ("provider", "native"):
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--engine", engine,
+                            "--path", path, "--chunk-size", str(args.chunk_size)], check=True)
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
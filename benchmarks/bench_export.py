@@ -0,0 +1,60 @@
+import argparse
+import csv
+import os
+import tempfile
+import time
+
+from _common import load_plugin_module, start_qgis, write_point_csv
+
+
+def per_field_export(layer, file_path, delimiter, x_field, y_field):
+    # The row loop save_to_csv used before the shared writer
+    with open(file_path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile, delimiter=delimiter)
+        fields = [field.name() for field in layer.fields()]
+        writer.writerow(fields)
+        for feature in layer.getFeatures():
+            row = []
+            for field_name in fields:
+                if field_name == x_field:
+                    row.append(feature.geometry().asPoint().x())
+                elif field_name == y_field:
+                    row.append(feature.geometry().asPoint().y())
+                else:
+                    row.append(feature[field_name])
+            writer.writerow(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the per-field export loop with the shared CSV writer.")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--columns", type=int, default=8)
+    args = parser.parse_args()
+
+    start_qgis()
+    csv_reader = load_plugin_module("csv_reader")
+    csv_writer = load_plugin_module("csv_writer")
+
+    source_path = write_point_csv(args.rows, args.columns)
+    fd, out_path = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    try:
+        options = {"file_path": source_path, "delimiter": ",", "x_field": "x", "y_field": "y", "detect_types": False}
+        layer = csv_reader.build_memory_layer(options, 50000)
+        runs = {
+            "per_field": lambda: per_field_export(layer, out_path, ",", "x", "y"),
+            "shared": lambda: csv_writer.write_features_csv(layer, layer.fields(), out_path, ",", "x", "y"),
+        }
+        for name, export in runs.items():
+            start = time.perf_counter()
+            export()
+            elapsed = time.perf_counter() - start
+            count = layer.featureCount()
+            print(f"{name:10s} {count} rows in {elapsed:.2f}s ({elapsed / count * 1e6:.2f} us/row)")
+    finally:
+        os.remove(source_path)
+        os.remove(out_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import argparse
+import os
+import time
+
+from _common import load_plugin_module, start_qgis, write_point_csv
+
+
+def open_source(path):
+    from qgis.core import QgsVectorLayer
+    uri = f"file://{path}?delimiter=,&xField=x&yField=y&detectTypes=no"
+    return QgsVectorLayer(uri, "bench_source", "delimitedtext")
+
+
+def new_memory_layer(source_layer):
+    from qgis.core import QgsVectorLayer
+    mem_layer = QgsVectorLayer("Point?crs=EPSG:4326", "bench", "memory")
+    mem_layer.dataProvider().addAttributes(source_layer.fields())
+    mem_layer.updateFields()
+    return mem_layer
+
+
+def per_feature_copy(source_layer, mem_layer):
+    provider = mem_layer.dataProvider()
+    mem_layer.startEditing()
+    for feature in source_layer.getFeatures():
+        provider.addFeature(feature)
+    mem_layer.commitChanges()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-feature and chunked import copy.")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    args = parser.parse_args()
+
+    start_qgis()
+    csv_reader = load_plugin_module("csv_reader")
+    path = write_point_csv(args.rows)
+    try:
+        runs = {
+            "per_feature": lambda src, mem: per_feature_copy(src, mem),
+            "chunked": lambda src, mem: csv_reader.copy_features(csv_reader.ProviderReader(path, ",", "x", "y"), mem.dataProvider(), args.chunk_size),
+        }
+        for name, copy in runs.items():
+            source_layer = open_source(path)
+            mem_layer = new_memory_layer(source_layer)
+            start = time.perf_counter()
+            copy(source_layer, mem_layer)
+            elapsed = time.perf_counter() - start
+            count = mem_layer.featureCount()
+            print(f"{name:12s} {count} rows in {elapsed:.2f}s ({count / elapsed:,.0f} rows/s)")
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
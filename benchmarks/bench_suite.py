@@ -0,0 +1,271 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from _common import PLUGIN_DIR, load_plugin_module, plugin_settings, start_qgis
+from generate_csv import DELIMITERS, QUOTING, TYPE_MIXES, cached_dataset, parse_delimiter
+
+# Import, reload and save throughput of the plugin on synthetic CSVs, through
+# the same functions the toolbar actions use. Every scenario runs in its own
+# process so its peak RSS is independent of the others. For example:
+#
+#   python bench_suite.py --rows 10000,1000000 --types text,mixed --output results.json
+#   python bench_suite.py --baseline results.json
+#
+# Generated files are kept in --data-dir and reused by later runs.
+
+SCENARIOS = ("import", "import_cached", "reload", "save", "save_delta", "multi_save")
+EDIT_EVERY = 100
+
+
+def _import(csv_path, options, operation=None):
+    core = load_plugin_module("core")
+    layer, _, fid_offsets = core.import_layer(options, operation=operation)
+    if layer is None:
+        raise RuntimeError(f"could not import {csv_path}")
+    return layer, fid_offsets
+
+
+def _edit_every_nth(layer, provider_only):
+    # Moves every EDIT_EVERY-th point, through the edit buffer or straight in
+    # the provider (which a reload then has to undo)
+    from qgis.core import QgsGeometry, QgsPointXY
+    fids = [feature.id() for i, feature in enumerate(layer.getFeatures()) if i % EDIT_EVERY == 0]
+    if provider_only:
+        layer.dataProvider().changeGeometryValues({fid: QgsGeometry.fromPointXY(QgsPointXY(0, 0)) for fid in fids})
+        return
+    layer.startEditing()
+    for fid in fids:
+        layer.changeGeometry(fid, QgsGeometry.fromPointXY(QgsPointXY(0, 0)))
+    layer.commitChanges()
+
+
+def _wait_for(done):
+    from qgis.PyQt.QtCore import QCoreApplication
+    while not done:
+        QCoreApplication.processEvents()
+        time.sleep(0.001)
+
+
+def run_scenario(scenario, csv_path, work_dir, layers):
+    # Returns the timing record of one scenario, see instrumentation.Operation
+    from qgis.core import QgsApplication, QgsProject
+    start_qgis()
+    core = load_plugin_module("core")
+    instrumentation = load_plugin_module("instrumentation")
+    row_journal = load_plugin_module("row_journal")
+    export_task = load_plugin_module("export_task")
+
+    options = dict(core.auto_import_options(csv_path), lazy=False)
+    out_path = os.path.join(work_dir, "out.csv")
+
+    def new_operation():
+        return instrumentation.Operation(scenario, csv_path)
+
+    if scenario == "import":
+        operation = new_operation()
+        layer, _ = _import(csv_path, options, operation)
+        with operation.phase("addMapLayer") as timing:
+            timing["rows"] = layer.featureCount()
+            QgsProject.instance().addMapLayer(layer)
+    elif scenario == "import_cached":
+        _import(csv_path, options)
+        operation = new_operation()
+        _import(csv_path, options, operation)
+    elif scenario == "reload":
+        layer, _ = _import(csv_path, options)
+        _edit_every_nth(layer, provider_only=True)
+        operation = new_operation()
+        core.reload_from_file(layer, "id", operation=operation)
+    elif scenario == "save":
+        layer, _ = _import(csv_path, options)
+        operation = new_operation()
+        core.write_layer(layer, out_path, operation=operation)
+    elif scenario == "save_delta":
+        layer, fid_offsets = _import(csv_path, options)
+        row_journal.attach(layer, fid_offsets, options["x_field"], options["y_field"])
+        _edit_every_nth(layer, provider_only=False)
+        operation = new_operation()
+        core.write_layer(layer, out_path, operation=operation)
+    elif scenario == "multi_save":
+        sources = [_import(csv_path, options)[0] for _ in range(layers)]
+        finished = []
+        tasks = [export_task.CsvExportTask(layer, os.path.join(work_dir, f"out{i}.csv"), lambda task, result: None)
+                 for i, layer in enumerate(sources)]
+        batch = export_task.CsvExportBatchTask(tasks, lambda batch, result: finished.append(result))
+        operation = new_operation()
+        with operation.phase("export write") as timing:
+            QgsApplication.taskManager().addTask(batch)
+            _wait_for(finished)
+            timing["rows"] = sum(layer.featureCount() for layer in sources)
+            timing["bytes"] = sum(os.path.getsize(task.file_path) for task in tasks)
+        errors = [task.error for task in tasks if task.error]
+        if errors:
+            raise RuntimeError(errors[0])
+    else:
+        raise ValueError(f"unknown scenario {scenario}")
+    return operation.finish()
+
+
+def _worker(args):
+    work_dir = tempfile.mkdtemp(prefix="editable_csv_bench_")
+    try:
+        start_qgis()
+        # Sidecars only for the scenario that measures them, and never in the user's cache
+        with plugin_settings(sidecar_cache=args.scenario == "import_cached", sidecar_dir=os.path.join(work_dir, "sidecars"),
+                             log_timings=False, timings_dir=""):
+            record = run_scenario(args.scenario, args.path, work_dir, args.layers)
+        with open(args.result, "w") as f:
+            json.dump(record, f)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _run_in_subprocess(scenario, csv_path, layers):
+    fd, result_path = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    try:
+        subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", scenario, "--path", csv_path,
+                        "--layers", str(layers), "--result", result_path], check=True)
+        with open(result_path) as f:
+            return json.load(f)
+    finally:
+        os.remove(result_path)
+
+
+def _plugin_version():
+    with open(os.path.join(PLUGIN_DIR, "metadata.txt")) as f:
+        for line in f:
+            if line.startswith("version="):
+                return line.split("=", 1)[1].strip()
+    return None
+
+
+def _qgis_version():
+    from qgis.core import Qgis
+    return getattr(Qgis, "QGIS_VERSION", None) or Qgis.version()
+
+
+def result_key(result):
+    return result["scenario"], result["dataset"]
+
+
+def compare(results, baseline, tolerance):
+    # Results at least `tolerance` (a fraction) slower than in the baseline
+    previous = {result_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = previous.get(result_key(result))
+        if old and old["rows_per_second"] and result["rows_per_second"] < old["rows_per_second"] * (1 - tolerance):
+            regressions.append({
+                "scenario": result["scenario"],
+                "dataset": result["dataset"],
+                "rows_per_second": result["rows_per_second"],
+                "baseline_rows_per_second": old["rows_per_second"],
+            })
+    return regressions
+
+
+def _int_list(text):
+    return [int(value) for value in text.split(",")]
+
+
+def _choice_list(choices):
+    def parse(text):
+        values = text.split(",")
+        for value in values:
+            if value not in choices:
+                raise argparse.ArgumentTypeError(f"{value!r} is not one of {', '.join(choices)}")
+        return values
+    return parse
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import, reload and save throughput on synthetic CSVs.")
+    parser.add_argument("--rows", type=_int_list, default=[10000, 100000], help="Comma separated row counts, e.g. 10000,10000000")
+    parser.add_argument("--columns", type=_int_list, default=[8], help="Comma separated numbers of extra columns")
+    parser.add_argument("--delimiters", type=lambda text: [parse_delimiter(value) for value in text.split(",")], default=[","],
+                        help="Comma separated delimiter names: comma, semicolon, tab, pipe")
+    parser.add_argument("--types", type=_choice_list(TYPE_MIXES), default=["mixed"], help="Comma separated type mixes: text, numeric, mixed")
+    parser.add_argument("--quoting", type=_choice_list(sorted(QUOTING)), default=["minimal"], help="Comma separated quoting styles: minimal, all, nonnumeric")
+    parser.add_argument("--scenarios", type=_choice_list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--layers", type=int, default=4, help="Number of layers saved by multi_save")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per scenario; the fastest one is reported")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "editable_csv_bench_data"))
+    parser.add_argument("--output", help="JSON file for the results (default: standard output)")
+    parser.add_argument("--baseline", help="Earlier results to compare with; slower results are reported as regressions")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Slowdown allowed before a result counts as a regression")
+    parser.add_argument("--worker", choices=SCENARIOS, dest="scenario", help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        _worker(args)
+        return 0
+
+    results = []
+    for rows, columns, delimiter, types, quoting in itertools.product(args.rows, args.columns, args.delimiters, args.types, args.quoting):
+        print(f"Generating {rows} rows, {columns} columns, {DELIMITERS.get(delimiter, delimiter)}, {types}, {quoting} quoting", file=sys.stderr)
+        csv_path = cached_dataset(args.data_dir, rows, columns, delimiter, types, quoting)
+        for scenario in args.scenarios:
+            records = [_run_in_subprocess(scenario, csv_path, args.layers) for _ in range(max(1, args.repeat))]
+            best = min(records, key=lambda record: record["seconds"])
+            seconds = best["seconds"]
+            result = {
+                "scenario": scenario,
+                "dataset": os.path.basename(csv_path),
+                "rows": rows,
+                "columns": columns,
+                "delimiter": delimiter,
+                "types": types,
+                "quoting": quoting,
+                "file_bytes": os.path.getsize(csv_path),
+                "seconds": seconds,
+                "runs": [record["seconds"] for record in records],
+                "rows_per_second": best["rows"] / seconds if seconds else 0.0,
+                "bytes_per_second": best["bytes"] / seconds if seconds else 0.0,
+                "peak_rss_mib": best["peak_rss_mib"],
+                "phases": best["phases"],
+            }
+            results.append(result)
+            print(f"  {scenario:13s} {seconds:8.3f}s {result['rows_per_second']:>14,.0f} rows/s "
+                  f"{result['bytes_per_second'] / (1024 * 1024):>9,.1f} MiB/s  peak RSS {result['peak_rss_mib']} MiB", file=sys.stderr)
+
+    start_qgis()
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "plugin_version": _plugin_version(),
+        "qgis_version": _qgis_version(),
+        "python_version": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = compare(results, json.load(f), args.tolerance)
+        for regression in report["regressions"]:
+            print(f"REGRESSION {regression['scenario']} on {regression['dataset']}: {regression['rows_per_second']:,.0f} rows/s, "
+                  f"was {regression['baseline_rows_per_second']:,.0f}", file=sys.stderr)
+        exit_code = 1 if report["regressions"] else 0
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
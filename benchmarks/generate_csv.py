@@ -0,0 +1,96 @@
+import argparse
+import csv
+import os
+import random
+
+# Synthetic point CSVs for the benchmarks. The same arguments always produce
+# the same file, so results of different releases are comparable.
+
+TYPE_MIXES = ("text", "numeric", "mixed")
+QUOTING = {
+    "minimal": csv.QUOTE_MINIMAL,
+    "all": csv.QUOTE_ALL,
+    "nonnumeric": csv.QUOTE_NONNUMERIC,
+}
+DELIMITERS = {",": "comma", ";": "semicolon", "\t": "tab", "|": "pipe"}
+
+
+def parse_delimiter(text):
+    # Accepts the delimiter itself or its name, e.g. "tab"
+    names = {name: delimiter for delimiter, name in DELIMITERS.items()}
+    return names.get(text, text)
+
+
+def _column_kinds(columns, types):
+    if types == "text":
+        return ["text"] * columns
+    if types == "numeric":
+        return ["integer" if c % 2 == 0 else "real" for c in range(columns)]
+    cycle = ("integer", "real", "text", "boolean", "date")
+    return [cycle[c % len(cycle)] for c in range(columns)]
+
+
+def _value(kind, rng, row, column, delimiter):
+    if kind == "integer":
+        return rng.randrange(-1000000, 1000000)
+    if kind == "real":
+        return round(rng.uniform(-1000, 1000), 4)
+    if kind == "boolean":
+        return "true" if rng.random() < 0.5 else "false"
+    if kind == "date":
+        return f"20{rng.randrange(10, 30)}-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}"
+    if row % 10 == 0:
+        # Some text needs quoting whatever the quoting style
+        return f'v{row}{delimiter} "{column}"'
+    return f"v{row}_{column}"
+
+
+def dataset_name(rows, columns, delimiter, types, quoting):
+    return f"points-{rows}r-{columns}c-{DELIMITERS.get(delimiter, 'custom')}-{types}-{quoting}.csv"
+
+
+def generate_csv(path, rows, columns=4, delimiter=",", types="mixed", quoting="minimal", seed=0):
+    # Writes `rows` points with an integer "id", "x", "y" and `columns` more
+    # columns of the given type mix. Returns the path.
+    rng = random.Random(f"{seed}-{rows}-{columns}-{types}")
+    kinds = _column_kinds(columns, types)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, delimiter=delimiter, quoting=QUOTING[quoting])
+        writer.writerow(["id", "x", "y"] + [f"{kind}_{c}" for c, kind in enumerate(kinds)])
+        batch = []
+        for i in range(rows):
+            row = [i, round(rng.uniform(-180, 180), 6), round(rng.uniform(-90, 90), 6)]
+            row += [_value(kind, rng, i, c, delimiter) for c, kind in enumerate(kinds)]
+            batch.append(row)
+            if len(batch) >= 10000:
+                writer.writerows(batch)
+                batch = []
+        writer.writerows(batch)
+    return path
+
+
+def cached_dataset(data_dir, rows, columns=4, delimiter=",", types="mixed", quoting="minimal"):
+    # The generated file in `data_dir`, written on first use
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, dataset_name(rows, columns, delimiter, types, quoting))
+    if not os.path.exists(path):
+        partial = path + ".part"
+        generate_csv(partial, rows, columns, delimiter, types, quoting)
+        os.replace(partial, path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic point CSV for benchmarking.")
+    parser.add_argument("path")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--columns", type=int, default=4)
+    parser.add_argument("--delimiter", type=parse_delimiter, default=",", help="The delimiter, or comma, semicolon, tab or pipe")
+    parser.add_argument("--types", choices=TYPE_MIXES, default="mixed")
+    parser.add_argument("--quoting", choices=sorted(QUOTING), default="minimal")
+    args = parser.parse_args()
+    generate_csv(args.path, args.rows, args.columns, args.delimiter, args.types, args.quoting)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import gzip
+import io
+import os
+import uuid
+from contextlib import contextmanager
+
+# Streaming access to plain, gzip (.gz) and zstd (.zst) compressed CSVs,
+# chosen by file extension. zstd needs Python 3.14's compression.zstd or the
+# zstandard package; gzip is always available.
+
+GZIP = "gzip"
+ZSTD = "zstd"
+SUFFIXES = {".gz": GZIP, ".gzip": GZIP, ".zst": ZSTD, ".zstd": ZSTD}
+EXTENSIONS = {GZIP: ".gz", ZSTD: ".zst"}
+READ_BUFFER_SIZE = 1024 * 1024
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+FILE_FILTER = "CSV Files (*.csv *.csv.gz *.csv.zst);;All Files (*)"
+# Rows are split on b"\n" before decoding, so only ASCII compatible encodings work
+ENCODINGS = ["UTF-8", "ISO-8859-1", "ISO-8859-15", "Windows-1252"]
+
+
+def compression_of(file_path):
+    # GZIP, ZSTD or None for an uncompressed file
+    return SUFFIXES.get(os.path.splitext(file_path)[1].lower())
+
+
+def strip_compression_suffix(file_path):
+    return os.path.splitext(file_path)[0] if compression_of(file_path) else file_path
+
+
+def temporary_path(file_path):
+    # An unused name next to `file_path`, with the same compression suffix,
+    # for output that is renamed over `file_path` once it is complete
+    directory, name = os.path.split(os.path.abspath(file_path))
+    suffix = os.path.splitext(name)[1] if compression_of(name) else ""
+    return os.path.join(directory, f".{name}.{uuid.uuid4().hex}.tmp{suffix}")
+
+
+def _zstd_module():
+    try:
+        from compression import zstd
+        return zstd, False
+    except ImportError:
+        pass
+    try:
+        import zstandard
+        return zstandard, True
+    except ImportError:
+        raise ValueError("Reading and writing .zst files needs Python 3.14 or the 'zstandard' package.") from None
+
+
+def _decompressing_reader(raw, kind):
+    if kind == GZIP:
+        return gzip.GzipFile(fileobj=raw, mode="rb")
+    zstd, is_zstandard = _zstd_module()
+    if is_zstandard:
+        return io.BufferedReader(zstd.ZstdDecompressor().stream_reader(raw, closefd=False), READ_BUFFER_SIZE)
+    return zstd.ZstdFile(raw, mode="rb")
+
+
+def _compressing_writer(raw, kind):
+    if kind == GZIP:
+        return gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=GZIP_LEVEL)
+    zstd, is_zstandard = _zstd_module()
+    if is_zstandard:
+        return io.BufferedWriter(zstd.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(raw, closefd=False), READ_BUFFER_SIZE)
+    return zstd.ZstdFile(raw, mode="wb", level=ZSTD_LEVEL)
+
+
+@contextmanager
+def open_read(file_path):
+    # Yields (stream, raw): `stream` gives the decompressed bytes, `raw` is
+    # the file on disk, whose tell() can be used for progress. They are the
+    # same object for an uncompressed file.
+    with open(file_path, "rb") as raw:
+        kind = compression_of(file_path)
+        if kind is None:
+            yield raw, raw
+            return
+        with _decompressing_reader(raw, kind) as stream:
+            yield stream, raw
+
+
+@contextmanager
+def open_text_write(file_path, encoding="utf-8", buffering=READ_BUFFER_SIZE):
+    # A text stream for csv.writer that compresses according to the file
+    # extension, so compressed output never exists uncompressed on disk
+    kind = compression_of(file_path)
+    if kind is None:
+        with open(file_path, "w", newline="", encoding=encoding, buffering=buffering) as f:
+            yield f
+        return
+    with open(file_path, "wb") as raw:
+        with _compressing_writer(raw, kind) as stream:
+            text = io.TextIOWrapper(stream, encoding=encoding, newline="", write_through=False)
+            try:
+                yield text
+            finally:
+                text.flush()
+                text.detach()
+
@@ -0,0 +1,205 @@
+import os
+
+from qgis.core import QgsExpression, QgsFeatureRequest
+
+from . import row_journal, settings, type_inference
+from .compressed_io import compression_of
+from .csv_reader import (build_memory_layer, cached_reader, create_spatial_index, open_reader, record_parsed_position, sniff_header,
+                         source_delimiter, source_encoding, source_unchanged)
+from .csv_writer import write_features_csv
+from .instrumentation import phase
+from .layer_reload import reload_layer
+from .layer_state import set_modified
+from .lazy_layer import build_lazy_layer, is_large_file
+from .row_journal import FidOffsets
+from .type_inference import TypeMismatch
+
+# The import, reload and save engines without any GUI, shared by the toolbar
+# actions in EditableCSV and the batch command line in batch.py. Failures that
+# should be shown to the user are raised as ValueError.
+
+
+def auto_import_options(file_path, encoding="utf-8"):
+    # Import options for a file whose delimiter and X/Y columns can be
+    # sniffed, as ImportCsvDialog.get_options would return them, or None.
+    header_info = sniff_header(file_path, encoding)
+    if not header_info or not header_info[2] or not header_info[3]:
+        return None
+    delimiter, _, x_field, y_field = header_info
+    return {
+        "file_path": file_path,
+        "delimiter": delimiter,
+        "x_field": x_field,
+        "y_field": y_field,
+        "detect_types": True,
+        "lazy": is_large_file(file_path),
+        "encoding": encoding,
+    }
+
+
+def import_layer(options, chunk_size=None, feedback=None, operation=None, use_sidecars=True):
+    # Returns (layer, lazy_index, fid_offsets). `lazy_index` is the
+    # (reader, (tiles, tile_size)) pair for a LazyCsvLayer when options["lazy"] is set,
+    # and `layer` is None if the file could not be read or the import was
+    # cancelled through `feedback`. The phases are timed on `operation`, an
+    # instrumentation.Operation. `use_sidecars` is passed on to
+    # build_memory_layer.
+    if chunk_size is None:
+        chunk_size = settings.value("import_chunk_size")
+    if options.get("lazy") and not compression_of(options["file_path"]):
+        result = build_lazy_layer(options, feedback=feedback, operation=operation)
+        if result is None:
+            return None, None, None
+        return result[0], result[1:], None
+    fid_offsets = FidOffsets()
+    layer = build_memory_layer(options, chunk_size, feedback=feedback, fid_offsets=fid_offsets, operation=operation,
+                               use_sidecars=use_sidecars)
+    return layer, None, fid_offsets
+
+
+def source_properties(layer):
+    # (delimiter, x_field, y_field) the layer was imported with, or None
+    properties = (source_delimiter(layer), layer.customProperty('original_x_field'),
+                  layer.customProperty('original_y_field'))
+    return properties if all(properties) else None
+
+
+def reload_from_file(layer, key_field, chunk_size=None, operation=None):
+    # Brings a fully loaded layer back in line with its file and returns
+    # (added, removed, changed). Pending edits are discarded.
+    if chunk_size is None:
+        chunk_size = settings.value("import_chunk_size")
+    original_file_path = layer.customProperty('original_file_path')
+    original_delimiter, original_x_field, original_y_field = source_properties(layer) or (None, None, None)
+    detect_types_str = layer.customProperty('detect_types', 'yes')
+
+    with phase(operation, "provider open"):
+        reader = open_reader(original_file_path, original_delimiter, original_x_field, original_y_field, detect_types_str,
+                             column_types=type_inference.deserialize(layer.customProperty('column_types')),
+                             encoding=source_encoding(layer))
+        reader = cached_reader(reader)
+
+    if not reader.is_valid():
+        raise ValueError(f"Failed to read original CSV file: {os.path.basename(original_file_path)}")
+
+    if [f.name() for f in reader.fields()] != [f.name() for f in layer.fields()]:
+        raise ValueError("The schema of the source CSV file has changed. Reloading is not supported in this case.")
+
+    try:
+        result = reload_layer(layer, reader, key_field, chunk_size, operation)
+    except TypeMismatch as e:
+        raise ValueError(f"{e}. Import the file again to read that column as text.") from None
+    # Layers imported without an index get one now; an existing one was
+    # kept up to date by the provider
+    with phase(operation, "spatial index") as timing:
+        timing["rows"] = create_spatial_index(layer)
+    row_journal.detach(layer.id())
+    set_modified(layer, False)
+    record_parsed_position(layer, original_file_path, reader.end_offset)
+    return result
+
+
+def can_patch_source(layer, file_path=None):
+    # Delta saves rewrite only the changed records of the original file,
+    # which is possible while it is untouched, all edits are committed and
+    # the layer still has the file's columns.
+    # Compressed files, as source or as target `file_path`, are always
+    # written in full.
+    original_file_path = layer.customProperty('original_file_path')
+    if compression_of(original_file_path or '') or (file_path and compression_of(file_path)):
+        return False
+    journal = row_journal.journal_for(layer.id())
+    return (settings.value("delta_save") and journal is not None and journal.matches_layer()
+            and not layer.isModified() and source_unchanged(layer, original_file_path))
+
+
+def write_layer(layer, file_path, lazy_controller=None, operation=None):
+    # Saves the layer to `file_path` with the delimiter and X/Y columns it
+    # was imported with. Partially loaded layers are saved through their
+    # LazyCsvLayer, passed as `lazy_controller`.
+    properties = source_properties(layer)
+    if properties is None:
+        raise ValueError("Original CSV properties not found for this layer.")
+    with phase(operation, "export write") as timing:
+        _write_layer(layer, file_path, properties, lazy_controller)
+        if lazy_controller is None:
+            timing["rows"] = layer.featureCount()
+        timing["bytes"] = os.path.getsize(file_path)
+
+
+def _write_layer(layer, file_path, properties, lazy_controller):
+    delimiter, x_field, y_field = properties
+    original_file_path = layer.customProperty('original_file_path')
+    encoding = source_encoding(layer)
+    if lazy_controller is not None:
+        if layer.isModified():
+            raise ValueError("commit or roll back the pending edits first, only part of this layer is loaded")
+        if compression_of(file_path):
+            raise ValueError("layers that only load features around the map view can only be saved uncompressed")
+        lazy_controller.save(file_path)
+        return
+    if can_patch_source(layer, file_path):
+        row_journal.journal_for(layer.id()).save(original_file_path, file_path, delimiter, encoding)
+        if overwrites_source(layer, file_path):
+            record_parsed_position(layer, file_path, os.path.getsize(file_path))
+    else:
+        write_features_csv(layer, layer.fields(), file_path, delimiter, x_field, y_field, encoding=encoding)
+        layer_written(layer, file_path)
+
+
+def overwrites_source(layer, file_path):
+    original_file_path = layer.customProperty('original_file_path')
+    return bool(original_file_path) and os.path.abspath(file_path) == os.path.abspath(original_file_path)
+
+
+def layer_written(layer, file_path):
+    # Call after every feature of the layer was written to `file_path`, also
+    # by a background export. When that replaced the layer's source, the
+    # record offsets in its journal no longer match the file and live
+    # refresh has to start from the new end.
+    if overwrites_source(layer, file_path):
+        row_journal.detach(layer.id())
+        record_parsed_position(layer, file_path, os.path.getsize(file_path))
+
+
+def keep_matching(layer, expression):
+    # Removes the features that do not match `expression` straight from the
+    # provider, without going through the edit buffer. Returns how many.
+    expression = QgsExpression(expression)
+    if expression.hasParserError():
+        raise ValueError(f"Invalid expression: {expression.parserErrorString()}")
+    request = QgsFeatureRequest(QgsExpression(f"NOT coalesce(({expression.expression()}), false)"))
+    request.setSubsetOfAttributes([])
+    fids = [feature.id() for feature in layer.getFeatures(request)]
+    if fids:
+        layer.dataProvider().deleteFeatures(fids)
+    return len(fids)
+
+
+def convert_file(file_path, out_path, options=None, where=None, chunk_size=None, operation=None, encoding="utf-8"):
+    # CSV -> point layer -> CSV in one call, for batch runs. The layer is
+    # always fully loaded, and the sidecar cache of the interactive plugin is
+    # left alone. Returns a dict with the number of rows read and written and
+    # the size of both files.
+    if options is None:
+        options = auto_import_options(file_path, encoding)
+        if options is None:
+            raise ValueError(f"Could not detect the delimiter and X/Y columns of {os.path.basename(file_path)}")
+    layer, _, _ = import_layer(dict(options, lazy=False), chunk_size, operation=operation, use_sidecars=False)
+    if layer is None:
+        raise ValueError(f"Failed to read CSV file: {os.path.basename(file_path)}")
+    rows_read = layer.featureCount()
+    if where:
+        keep_matching(layer, where)
+    with phase(operation, "export write") as timing:
+        timing["rows"] = write_features_csv(layer, layer.fields(), out_path, options["delimiter"], options["x_field"], options["y_field"],
+                                            encoding=options.get("encoding") or "utf-8")
+        timing["bytes"] = os.path.getsize(out_path)
+    return {
+        "file": file_path,
+        "output": out_path,
+        "rows_read": rows_read,
+        "rows_written": layer.featureCount(),
+        "bytes_read": os.path.getsize(file_path),
+        "bytes_written": os.path.getsize(out_path),
+    }
@@ -0,0 +1,86 @@
+import csv
+import io
+import os
+import threading
+from collections import OrderedDict
+from itertools import chain
+
+from . import settings
+from .compressed_io import open_read
+from .type_inference import infer_column_types
+
+SNIFF_BYTES = 1024
+
+
+class CsvFileInfo:
+    # What the plugin needs to know about a CSV before parsing it. Built once
+    # per (path, mtime, size) and shared by the dialog, import and reload.
+    def __init__(self, file_path, mtime, size, delimiter, header, column_types, encoding="utf-8"):
+        self.file_path = file_path
+        self.encoding = encoding
+        self.mtime = mtime
+        self.size = size
+        self.delimiter = delimiter
+        self.header = header
+        self.column_types = column_types
+
+
+def _build_info(file_path, mtime, size, encoding):
+    with open_read(file_path) as (stream, _):
+        # Whole lines are read for sniffing and then parsed again, since
+        # compressed streams cannot seek back cheaply
+        f = io.TextIOWrapper(stream, encoding=encoding, newline='')
+        head = []
+        while sum(map(len, head)) < SNIFF_BYTES:
+            line = f.readline()
+            if not line:
+                break
+            head.append(line)
+        dialect = csv.Sniffer().sniff(''.join(head)[:SNIFF_BYTES])
+        reader = csv.reader(chain(head, f), dialect)
+        header = next(reader)
+        if header:
+            # The readers drop a UTF-8 byte order mark as well
+            header[0] = header[0].lstrip("\ufeff")
+        sample = [row for _, row in zip(range(settings.value("type_sample_rows")), reader)]
+        f.detach()
+    return CsvFileInfo(file_path, mtime, size, dialect.delimiter, header, infer_column_types(sample, len(header)), encoding)
+
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def file_info(file_path, encoding="utf-8"):
+    # Raises OSError/csv.Error/UnicodeDecodeError if the file cannot be read
+    # or sniffed
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), encoding.lower())
+    with _lock:
+        info = _cache.get(key)
+        if info is not None and info.mtime == stat.st_mtime_ns and info.size == stat.st_size:
+            _cache.move_to_end(key)
+            return info
+
+    info = _build_info(file_path, stat.st_mtime_ns, stat.st_size, encoding)
+    with _lock:
+        _cache[key] = info
+        _cache.move_to_end(key)
+        while len(_cache) > max(1, settings.value("metadata_cache_entries")):
+            _cache.popitem(last=False)
+    return info
+
+
+def remember_column_types(file_path, encoding, column_types):
+    # Replaces the sampled column types of an unchanged file with the ones a
+    # full read settled on, so the next import starts with those
+    key = (os.path.abspath(file_path), encoding.lower())
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return
+    with _lock:
+        info = _cache.get(key)
+        if info is not None and info.mtime == stat.st_mtime_ns and info.size == stat.st_size:
+            info.column_types = list(column_types)
+
@@ -0,0 +1,144 @@
+import csv
+import io
+import os
+import shutil
+import tempfile
+from bisect import bisect_right
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def record_end(f, offset, delimiter, encoding="utf-8"):
+    # Byte offset just past the CSV record starting at `offset`, which may
+    # span several lines when a quoted value contains newlines.
+    f.seek(offset)
+    consumed = 0
+
+    def lines():
+        nonlocal consumed
+        for line in f:
+            consumed += len(line)
+            yield line.decode(encoding)
+
+    next(csv.reader(lines(), delimiter=delimiter), None)
+    return offset + consumed
+
+
+def encode_row(row, delimiter, line_terminator, encoding="utf-8"):
+    buffer = io.StringIO()
+    csv.writer(buffer, delimiter=delimiter, lineterminator=line_terminator).writerow(row)
+    return buffer.getvalue().encode(encoding)
+
+
+def _write_all(out, data):
+    # An unbuffered write may take only part of the data
+    view = memoryview(data)
+    while view:
+        view = view[out.write(view):]
+
+
+def _copy_range(src, out, start, end):
+    # Copies src[start:end] to the unbuffered `out` and returns the number of
+    # bytes copied. Uses sendfile where the OS supports it, so unchanged data
+    # never passes through Python.
+    count = end - start
+    if count <= 0:
+        return 0
+    done = 0
+    if hasattr(os, "sendfile"):
+        try:
+            while done < count:
+                sent = os.sendfile(out.fileno(), src.fileno(), start + done, count - done)
+                if sent == 0:
+                    raise EOFError(f"source ended {count - done} bytes early")
+                done += sent
+            return done
+        except OSError:
+            # Carry on from what sendfile already wrote
+            pass
+    src.seek(start + done)
+    while done < count:
+        data = src.read(min(COPY_BUFFER_SIZE, count - done))
+        if not data:
+            raise EOFError(f"source ended {count - done} bytes early")
+        _write_all(out, data)
+        done += len(data)
+    return done
+
+
+class PatchResult:
+    # Where things ended up in the patched file, so callers that keep record
+    # offsets can follow them.
+    def __init__(self):
+        # (source start, output start) for each range copied verbatim
+        self.segments = []
+        # source offset of a replaced record -> its offset in the output
+        self.replaced = {}
+        # output offsets of the appended rows, in order
+        self.appended = []
+
+    def new_offset(self, offset):
+        # Output offset of an unchanged source record
+        if offset in self.replaced:
+            return self.replaced[offset]
+        i = bisect_right(self.segments, (offset, float("inf"))) - 1
+        src_start, out_start = self.segments[i]
+        return out_start + offset - src_start
+
+
+def write_patched_csv(source_path, out_path, replacements, appended_rows, delimiter, encoding="utf-8"):
+    # Writes `source_path` to `out_path` with the records starting at the
+    # offsets in `replacements` swapped for the given row (or dropped when the
+    # row is None), then `appended_rows` at the end. Everything else, header
+    # included, is copied byte for byte. The output goes to a temporary file
+    # that is renamed over `out_path` at the end, so `out_path` may be the
+    # source itself and readers never see a half-written file.
+    result = PatchResult()
+    directory = os.path.dirname(os.path.abspath(out_path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=directory)
+    try:
+        with open(source_path, "rb") as src, os.fdopen(fd, "wb", buffering=0) as out:
+            size = os.fstat(src.fileno()).st_size
+            header = src.readline()
+            line_terminator = "\r\n" if header.endswith(b"\r\n") else "\n"
+
+            pos = 0
+            written = 0
+            ends_with_newline = True
+            for offset in sorted(replacements):
+                if offset > pos:
+                    result.segments.append((pos, written))
+                    written += _copy_range(src, out, pos, offset)
+                    ends_with_newline = True
+                row = replacements[offset]
+                if row is not None:
+                    data = encode_row(row, delimiter, line_terminator, encoding)
+                    _write_all(out, data)
+                    result.replaced[offset] = written
+                    written += len(data)
+                pos = record_end(src, offset, delimiter, encoding)
+            if size > pos:
+                result.segments.append((pos, written))
+                written += _copy_range(src, out, pos, size)
+                src.seek(size - 1)
+                ends_with_newline = src.read(1) == b"\n"
+
+            if appended_rows:
+                data = []
+                if not ends_with_newline:
+                    data.append(line_terminator.encode(encoding))
+                    written += len(data[0])
+                for row in appended_rows:
+                    encoded = encode_row(row, delimiter, line_terminator, encoding)
+                    result.appended.append(written)
+                    written += len(encoded)
+                    data.append(encoded)
+                _write_all(out, b"".join(data))
+            os.fsync(out.fileno())
+        shutil.copymode(source_path, tmp_path)
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return result
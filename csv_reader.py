@@ -0,0 +1,453 @@
+import csv
+import os
+import zlib
+from itertools import islice
+
+from qgis.core import Qgis, QgsFeature, QgsFields, QgsGeometry, QgsPointXY, QgsVectorLayer
+from PyQt5.QtCore import QUrl, QUrlQuery
+
+from . import settings
+from .compressed_io import compression_of, open_read, strip_compression_suffix
+from .csv_metadata import file_info, remember_column_types
+from .instrumentation import log_message, phase
+from .sidecar_cache import SidecarWriter, open_sidecar
+from .type_inference import STRING, TypeMismatch, converters, qgs_field, serialize
+
+ENGINE_NATIVE = "native"
+ENGINE_PROVIDER = "provider"
+DEFAULT_CRS = "EPSG:4326"
+CHECKSUM_BYTES = 4096
+
+
+def iter_feature_chunks(features, chunk_size):
+    iterator = iter(features)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def provider_uri(file_path, delimiter, x_field, y_field, detect_types, encoding="utf-8"):
+    # Built with QUrl so paths with spaces, '#' or '?' and delimiters such as
+    # a tab are escaped properly
+    url = QUrl.fromLocalFile(file_path)
+    query = QUrlQuery()
+    for key, value in (("encoding", encoding), ("type", "csv"), ("delimiter", delimiter), ("xField", x_field),
+                       ("yField", y_field), ("detectTypes", detect_types)):
+        query.addQueryItem(key, value)
+    url.setQuery(query)
+    return url.toString(QUrl.FullyEncoded)
+
+
+class ProviderReader:
+    # Reads through the QGIS delimitedtext provider. Kept as the fallback engine.
+    engine = ENGINE_PROVIDER
+
+    def __init__(self, file_path, delimiter, x_field, y_field, detect_types="no", encoding="utf-8"):
+        self.file_path = file_path
+        self.fraction = 0.0
+        # The provider cannot say how far it read, so assume the file as it was when opened
+        self.end_offset = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+        uri = provider_uri(file_path, delimiter, x_field, y_field, detect_types, encoding)
+        self.layer = QgsVectorLayer(uri, "source_csv_temp", "delimitedtext")
+
+    def is_valid(self):
+        return self.layer.isValid()
+
+    def fields(self):
+        return self.layer.fields()
+
+    def crs(self):
+        return self.layer.crs().authid() if self.layer.crs().isValid() else DEFAULT_CRS
+
+    def feature_chunks(self, chunk_size):
+        total = max(self.layer.featureCount(), 1)
+        done = 0
+        for chunk in iter_feature_chunks(self.layer.getFeatures(), chunk_size):
+            done += len(chunk)
+            self.fraction = done / total
+            yield chunk
+
+
+class NativeReader:
+    # Streams the file once with csv.reader and builds the features itself,
+    # so the data is not parsed by the provider and then copied a second time.
+    engine = ENGINE_NATIVE
+
+    def __init__(self, file_path, delimiter, x_field, y_field, encoding="utf-8", column_types=None):
+        self.file_path = file_path
+        self.delimiter = delimiter
+        self.x_field = x_field
+        self.y_field = y_field
+        self.encoding = encoding
+        self.fraction = 0.0
+        self.end_offset = 0
+        self._raw = None
+        self.header = self._read_header()
+        if column_types is None or len(column_types) != len(self.header):
+            column_types = [STRING] * len(self.header)
+        self._set_column_types(column_types)
+        if self.is_valid():
+            self._x_index = self.header.index(x_field)
+            self._y_index = self.header.index(y_field)
+
+    def _set_column_types(self, column_types):
+        self.column_types = list(column_types)
+        self._converters = converters(self.column_types)
+        self._fields = QgsFields()
+        for name, column_type in zip(self.header, self.column_types):
+            self._fields.append(qgs_field(name, column_type))
+
+    def read_as_text(self, column):
+        # Drops the type of a column after a TypeMismatch. Features already
+        # built keep the old type.
+        column_types = list(self.column_types)
+        column_types[column] = STRING
+        self._set_column_types(column_types)
+
+    def _lines(self, f, complete_only=False):
+        # Keeps self.end_offset just past the last line handed to csv.reader.
+        # With complete_only a trailing line still being written is left alone.
+        for line in f:
+            if complete_only and not line.endswith(b"\n"):
+                return
+            self.end_offset += len(line)
+            yield line.decode(self.encoding)
+
+    def _read_header(self):
+        try:
+            info = file_info(self.file_path, self.encoding)
+            header = list(info.header) if info.delimiter == self.delimiter else None
+        except Exception:
+            header = None
+        if header is None:
+            try:
+                with open_read(self.file_path) as (f, _):
+                    header = next(csv.reader(self._lines(f), delimiter=self.delimiter), [])
+            except (OSError, EOFError, LookupError, ValueError, csv.Error):
+                return []
+        if header:
+            header[0] = header[0].lstrip("\ufeff")
+        return header
+
+    def is_valid(self):
+        return self.x_field in self.header and self.y_field in self.header
+
+    def fields(self):
+        return self._fields
+
+    def crs(self):
+        return DEFAULT_CRS
+
+    def iter_rows(self, start_offset=0):
+        # Yields (byte offset where the record starts, row) for each data row.
+        # With a start_offset only the rows after it are read; the header is
+        # not expected there and a trailing line still being written is skipped.
+        # Offsets count decompressed bytes for compressed files.
+        with open_read(self.file_path) as (f, raw):
+            self._raw = raw
+            if start_offset:
+                f.seek(start_offset)
+            self.end_offset = start_offset
+            reader = csv.reader(self._lines(f, complete_only=start_offset > 0), delimiter=self.delimiter)
+            if not start_offset:
+                next(reader, None)
+            while True:
+                offset = self.end_offset
+                row = next(reader, None)
+                if row is None:
+                    return
+                yield offset, row
+
+    def read_rows_at(self, offsets):
+        # Yields (offset, row) for the records starting at the given offsets.
+        # Needs an uncompressed file, which lazy layers always have.
+        with open_read(self.file_path) as (f, _):
+            for offset in sorted(offsets):
+                f.seek(offset)
+                row = next(csv.reader(self._lines(f), delimiter=self.delimiter), None)
+                if row is not None:
+                    yield offset, row
+
+    def convert_row(self, row):
+        # Converts the typed columns of a row of header width in place. Raises
+        # TypeMismatch for a value that does not parse as its column's type.
+        for i, convert in self._converters:
+            try:
+                row[i] = convert(row[i])
+            except ValueError:
+                raise TypeMismatch(self.header[i], i, self.column_types[i], row[i]) from None
+
+    def feature(self, row):
+        # Returns the point feature for a parsed row, or None if the row has
+        # no usable coordinates (the provider drops those rows as well).
+        # `row` itself is left as it is, it may belong to a RowJournal.
+        width = len(self.header)
+        if len(row) != width:
+            if not row:
+                return None
+            row = (row + [None] * width)[:width]
+        elif self._converters:
+            row = list(row)
+        try:
+            point = QgsPointXY(float(row[self._x_index]), float(row[self._y_index]))
+        except (TypeError, ValueError):
+            return None
+        self.convert_row(row)
+        feature = QgsFeature(self._fields)
+        feature.setAttributes(row)
+        feature.setGeometry(QgsGeometry.fromPointXY(point))
+        return feature
+
+    def feature_chunks(self, chunk_size, start_offset=0):
+        # After each chunk is yielded, chunk_offsets holds the byte offset of
+        # the record each of its features was read from.
+        total = max(os.path.getsize(self.file_path), 1)
+        chunk = []
+        offsets = []
+        for offset, row in self.iter_rows(start_offset):
+            feature = self.feature(row)
+            if feature is None:
+                continue
+            chunk.append(feature)
+            offsets.append(offset)
+            if len(chunk) >= chunk_size:
+                self.fraction = min(self._raw.tell() / total, 1.0)
+                self.chunk_offsets = offsets
+                yield chunk
+                chunk = []
+                offsets = []
+        self.fraction = 1.0
+        if chunk:
+            self.chunk_offsets = offsets
+            yield chunk
+
+
+def open_reader(file_path, delimiter, x_field, y_field, detect_types="no", engine=None, column_types=None, encoding="utf-8"):
+    # With detect_types "yes" the native engine uses `column_types` when given
+    # (e.g. the schema stored on a layer) and infers them from a sample of the
+    # file otherwise. Compressed files are always read by the native engine.
+    if engine is None:
+        engine = settings.value("import_engine")
+    if engine != ENGINE_NATIVE and not compression_of(file_path):
+        return ProviderReader(file_path, delimiter, x_field, y_field, detect_types, encoding)
+    if detect_types != "yes":
+        column_types = None
+    elif column_types is None:
+        try:
+            info = file_info(file_path, encoding)
+            if info.delimiter == delimiter:
+                column_types = info.column_types
+        except Exception:
+            pass
+    return NativeReader(file_path, delimiter, x_field, y_field, encoding, column_types=column_types)
+
+
+def sniff_header(file_path, encoding="utf-8"):
+    # Returns (delimiter, header, x_field, y_field), or None if the file
+    # cannot be sniffed.
+    try:
+        info = file_info(file_path, encoding)
+    except Exception as e:
+        log_message(f"Error reading CSV header of {file_path}: {e}", Qgis.Warning)
+        return None
+
+    x_field = ''
+    y_field = ''
+    # Auto-select X and Y fields if present
+    for field in info.header:
+        if field.lower() == 'x':
+            x_field = field
+        if field.lower() == 'y':
+            y_field = field
+    return info.delimiter, list(info.header), x_field, y_field
+
+
+def cached_reader(reader):
+    # The sidecar of a native reader's file, if one was written for the same
+    # file contents and options, otherwise the reader itself
+    if reader.engine == ENGINE_NATIVE and reader.is_valid() and settings.value("sidecar_cache"):
+        return open_sidecar(reader) or reader
+    return reader
+
+
+def copy_features(reader, provider, chunk_size, feedback=None, fid_offsets=None, sidecar=None):
+    # One addFeatures call per chunk; the memory provider takes the whole list
+    # in C++ so we only pay the Python overhead of iterating the source.
+    # `feedback` is anything with isCanceled()/setProgress(), e.g. a QgsTask.
+    # With `fid_offsets` (native engine only) the record offset of every new
+    # feature is stored under its fid. A SidecarWriter given as `sidecar`
+    # receives every chunk as well; it is dropped if it cannot be written.
+    count = 0
+    for chunk in reader.feature_chunks(chunk_size):
+        if feedback is not None and feedback.isCanceled():
+            break
+        ok, added = provider.addFeatures(chunk)
+        if fid_offsets is not None:
+            for feature, offset in zip(added, reader.chunk_offsets):
+                fid_offsets[feature.id()] = offset
+        if sidecar is not None:
+            try:
+                sidecar.add(chunk, reader.chunk_offsets)
+            except OSError:
+                sidecar.discard()
+                sidecar = None
+        count += len(chunk)
+        if feedback is not None:
+            feedback.setProgress(reader.fraction * 100)
+    if sidecar is not None:
+        if feedback is not None and feedback.isCanceled():
+            sidecar.discard()
+        else:
+            try:
+                sidecar.commit(reader.end_offset)
+            except OSError:
+                sidecar.discard()
+    return count
+
+
+def layer_name_for(file_path):
+    return os.path.basename(strip_compression_suffix(file_path)).replace('.csv', '')
+
+
+def build_memory_layer(options, chunk_size, feedback=None, fid_offsets=None, operation=None, use_sidecars=True):
+    # Reads the CSV described by `options` (as returned by ImportCsvDialog.get_options)
+    # into a new memory layer. Returns None if the file could not be read or
+    # the import was cancelled. `fid_offsets` is filled when the native engine
+    # is used, and left empty otherwise. The "provider open" and "feature copy"
+    # phases are timed on `operation`, an instrumentation.Operation. Without
+    # `use_sidecars` the sidecar cache is neither read nor written.
+    file_path = options["file_path"]
+    delimiter = options["delimiter"]
+    x_field = options["x_field"]
+    y_field = options["y_field"]
+    detect_types = "yes" if options["detect_types"] else "no"
+    encoding = options.get("encoding") or "utf-8"
+
+    with phase(operation, "provider open"):
+        reader = open_reader(file_path, delimiter, x_field, y_field, detect_types, encoding=encoding)
+        if not reader.is_valid():
+            return None
+        cached = cached_reader(reader) if use_sidecars else reader
+        mem_layer, sidecar = _new_memory_layer(reader, file_path, write_sidecar=use_sidecars and cached is reader)
+        reader = cached
+
+    while True:
+        try:
+            with phase(operation, "feature copy") as timing:
+                timing["rows"] = copy_features(reader, mem_layer.dataProvider(), chunk_size, feedback,
+                                               fid_offsets if reader.engine == ENGINE_NATIVE else None, sidecar)
+                timing["bytes"] = reader.end_offset
+            break
+        except TypeMismatch as e:
+            # The sampled rows did not show every kind of value in this
+            # column: read it as text and start over
+            log_message(f"{e}; reading it as text", Qgis.Info)
+            if sidecar is not None:
+                sidecar.discard()
+            if fid_offsets is not None:
+                fid_offsets.clear()
+            reader.read_as_text(e.column)
+            remember_column_types(file_path, encoding, reader.column_types)
+            mem_layer, sidecar = _new_memory_layer(reader, file_path, write_sidecar=use_sidecars)
+    if feedback is not None and feedback.isCanceled():
+        return None
+    with phase(operation, "spatial index") as timing:
+        timing["rows"] = create_spatial_index(mem_layer)
+    mem_layer.updateExtents()
+
+    set_source_properties(mem_layer, file_path, delimiter, x_field, y_field, detect_types, encoding)
+    if reader.engine == ENGINE_NATIVE:
+        mem_layer.setCustomProperty('column_types', serialize(reader.column_types))
+    record_parsed_position(mem_layer, file_path, reader.end_offset)
+    return mem_layer
+
+
+def _new_memory_layer(reader, file_path, write_sidecar):
+    # An empty point layer with the reader's fields, and the SidecarWriter
+    # for it when `write_sidecar` is set and the sidecar cache is enabled
+    sidecar = None
+    if write_sidecar and reader.engine == ENGINE_NATIVE and settings.value("sidecar_cache"):
+        try:
+            sidecar = SidecarWriter(reader)
+        except OSError:
+            sidecar = None
+    mem_layer = QgsVectorLayer(f"Point?crs={reader.crs()}", layer_name_for(file_path), "memory")
+    mem_layer.dataProvider().addAttributes(reader.fields())
+    mem_layer.updateFields()
+    return mem_layer, sidecar
+
+
+def create_spatial_index(layer):
+    # Memory layers only get a spatial index when asked for one. It keeps
+    # identify, rectangle selection and rendering of zoomed-in views from
+    # scanning every point, and the provider updates it as features change.
+    # Returns the number of features indexed, or None without an index.
+    if not settings.value("spatial_index"):
+        return None
+    provider = layer.dataProvider()
+    provider.createSpatialIndex()
+    return provider.featureCount()
+
+
+def set_source_properties(layer, file_path, delimiter, x_field, y_field, detect_types, encoding="utf-8"):
+    layer.setCustomProperty('original_delimiter', encode_delimiter(delimiter))
+    layer.setCustomProperty('original_x_field', x_field)
+    layer.setCustomProperty('original_y_field', y_field)
+    layer.setCustomProperty('original_file_path', file_path)
+    layer.setCustomProperty('original_encoding', encoding)
+    layer.setCustomProperty('detect_types', detect_types)
+
+
+def encode_delimiter(delimiter):
+    # A tab is stored as \t, as in delimited text URIs, so it survives the
+    # whitespace handling of the project file's XML
+    return "\\t" if delimiter == "\t" else delimiter
+
+
+def decode_delimiter(text):
+    return "\t" if text == "\\t" else text
+
+
+def source_delimiter(layer):
+    return decode_delimiter(layer.customProperty('original_delimiter'))
+
+
+def source_encoding(layer):
+    return layer.customProperty('original_encoding') or "utf-8"
+
+
+def file_head_checksum(file_path, length):
+    with open(file_path, "rb") as f:
+        return zlib.crc32(f.read(min(length, CHECKSUM_BYTES)))
+
+
+def file_tail_checksum(file_path, offset):
+    # Checksum of the bytes just before `offset`, the end of what was parsed
+    with open(file_path, "rb") as f:
+        start = max(offset - CHECKSUM_BYTES, 0)
+        f.seek(start)
+        return zlib.crc32(f.read(offset - start))
+
+
+def source_unchanged(layer, file_path):
+    # True if the file is still exactly what the layer was read from
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return False
+    return (stat.st_size == int(layer.customProperty('parsed_size', -1))
+            and stat.st_mtime_ns == int(layer.customProperty('parsed_mtime', -1)))
+
+
+def record_parsed_position(layer, file_path, offset):
+    # Remembers how much of the file the layer reflects, and checksums of its
+    # start and of the bytes up to `offset`, so a later refresh can tell an
+    # append from a rewrite.
+    stat = os.stat(file_path)
+    layer.setCustomProperty('parsed_offset', offset)
+    layer.setCustomProperty('parsed_size', stat.st_size)
+    layer.setCustomProperty('parsed_mtime', stat.st_mtime_ns)
+    layer.setCustomProperty('parsed_head_checksum', file_head_checksum(file_path, offset))
+    layer.setCustomProperty('parsed_tail_checksum', file_tail_checksum(file_path, offset))
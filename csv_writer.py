@@ -0,0 +1,95 @@
+import csv
+import os
+import shutil
+
+from qgis.core import NULL, QgsFeatureRequest
+from PyQt5.QtCore import QDate, Qt, QVariant
+
+from .compressed_io import open_text_write, temporary_path
+
+WRITE_BUFFER_SIZE = 1024 * 1024
+ROW_BATCH_SIZE = 10000
+
+
+def _format_date(value):
+    return value.toString(Qt.ISODate) if isinstance(value, QDate) else value
+
+
+def _format_bool(value):
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    return value
+
+
+def value_formatters(fields):
+    # (column index, formatter) for the typed columns csv.writer would not
+    # write the way they are read back
+    result = []
+    for i, field in enumerate(fields):
+        if field.type() == QVariant.Date:
+            result.append((i, _format_date))
+        elif field.type() == QVariant.Bool:
+            result.append((i, _format_bool))
+    return result
+
+
+def write_features_csv(source, fields, file_path, delimiter, x_field, y_field, feedback=None, total=0, encoding="utf-8"):
+    # `source` is anything with getFeatures(request): a layer, or a
+    # QgsVectorLayerFeatureSource when running outside the main thread.
+    # The X/Y columns are written from the point geometry, all others by
+    # position straight from feature.attributes(). A .gz or .zst file_path
+    # is compressed while it is written.
+    names = [field.name() for field in fields]
+    x_index = names.index(x_field) if x_field in names else -1
+    y_index = names.index(y_field) if y_field in names else -1
+
+    formatters = value_formatters(fields)
+
+    request = QgsFeatureRequest()
+    request.setSubsetOfAttributes([i for i in range(len(names)) if i not in (x_index, y_index)])
+
+    # The rows go to a temporary file that replaces `file_path` only once
+    # it is complete, so a cancelled or failed save leaves it untouched
+    tmp_path = temporary_path(file_path)
+    count = 0
+    try:
+        with open_text_write(tmp_path, encoding, WRITE_BUFFER_SIZE) as csvfile:
+            writer = csv.writer(csvfile, delimiter=delimiter)
+            writer.writerow(names)
+
+            batch = []
+            for feature in source.getFeatures(request):
+                row = feature.attributes()
+                if NULL in row:
+                    row = ['' if value == NULL else value for value in row]
+                for i, format_value in formatters:
+                    row[i] = format_value(row[i])
+                geometry = feature.geometry()
+                if not geometry.isNull():
+                    point = geometry.asPoint()
+                    if x_index >= 0:
+                        row[x_index] = point.x()
+                    if y_index >= 0:
+                        row[y_index] = point.y()
+                batch.append(row)
+                if len(batch) >= ROW_BATCH_SIZE:
+                    writer.writerows(batch)
+                    count += len(batch)
+                    batch = []
+                    if feedback is not None:
+                        if feedback.isCanceled():
+                            break
+                        if total:
+                            feedback.setProgress(min(count / total * 100, 100))
+            writer.writerows(batch)
+            count += len(batch)
+        if feedback is None or not feedback.isCanceled():
+            if os.path.exists(file_path):
+                shutil.copymode(file_path, tmp_path)
+            os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return count
@@ -1,15 +1,36 @@
-from qgis.core import QgsProject, QgsVectorLayer, QgsVectorFileWriter, Qgis, QgsFeature
+from qgis.core import QgsApplication, QgsExpression, QgsProject, QgsVectorLayer, QgsVectorFileWriter, Qgis
 from qgis.gui import QgsMessageBar
-from PyQt5.QtWidgets import QAction, QToolBar, QFileDialog, QMessageBox
+from PyQt5.QtWidgets import QAction, QToolBar, QFileDialog, QInputDialog, QMessageBox, QProgressDialog
+from PyQt5.QtCore import QCoreApplication, Qt, QTimer
 from PyQt5.QtGui import QIcon
 import os.path
-import csv
+from concurrent.futures import ThreadPoolExecutor
+
+from . import core, geometry_ops, row_journal, settings
+from .compressed_io import FILE_FILTER
+from .csv_reader import sniff_header
+from .instrumentation import Operation, phase
+from .layer_reload import KEY_FIELD_PROPERTY
+from .lazy_layer import LazyCsvLayer, is_large_file
+from .live_refresh import LIVE_REFRESH_PROPERTY, LiveRefreshWatcher
+from .layer_state import is_modified, is_plugin_layer, plugin_layers, set_modified, track_changes
+
+def _timed_sniff(operation):
+    with operation.phase("sniff"):
+        return sniff_header(operation.target)
+
 
 class EditableCSV:
     def __init__(self, iface):
         self.iface = iface
         self.toolbar = None
         self.actions = []
+        self._pending_imports = []
+        self._import_tasks = []
+        self._index_tasks = []
+        self._export_batches = []
+        self._tracked_layer_ids = set()
+        self._lazy_layers = {}
 
     def initGui(self):
         self.toolbar = QToolBar("Editable CSV")
@@ -19,27 +40,77 @@ class EditableCSV:
         self.import_csv_action = QAction(QIcon(os.path.dirname(__file__) + "/icon.png"), "Import Editable CSV", self.iface.mainWindow())
         self.reload_action = QAction(QIcon(os.path.dirname(__file__) + "/undo.png"), "Reload Layer from File", self.iface.mainWindow())
         self.delete_point_action = QAction(QIcon(os.path.dirname(__file__) + "/delete.png"), "Delete Selected Point(s)", self.iface.mainWindow())
+        self.delete_by_filter_action = QAction("Delete Points by Expression or Extent", self.iface.mainWindow())
+        self.edit_positions_action = QAction("Edit Point Positions", self.iface.mainWindow())
+        self.edit_positions_action.setToolTip("Snap points to a grid, shift the selected points or remove duplicate points")
         self.save_to_csv_action = QAction(QIcon(os.path.dirname(__file__) + "/save.png"), "Save selected CSV", self.iface.mainWindow())
         self.save_multiple_action = QAction(QIcon(os.path.dirname(__file__) + "/save_multiple.png"), "Save all modified CSVs", self.iface.mainWindow())
+        self.live_refresh_action = QAction("Live Refresh", self.iface.mainWindow())
+        self.live_refresh_action.setToolTip("Append rows added to the selected layer's CSV file automatically")
+        self.live_refresh_action.setCheckable(True)
 
         # Connect to signals
         self.import_csv_action.triggered.connect(self.import_csv)
         self.reload_action.triggered.connect(self.reload_layer_data)
         self.delete_point_action.triggered.connect(self.delete_point)
+        self.delete_by_filter_action.triggered.connect(self.delete_points_by_filter)
+        self.edit_positions_action.triggered.connect(self.edit_point_positions)
         self.save_to_csv_action.triggered.connect(self.save_to_csv)
         self.save_multiple_action.triggered.connect(self.save_multiple_csvs)
+        self.live_refresh_action.triggered.connect(self.toggle_live_refresh)
+        self.iface.currentLayerChanged.connect(self._update_live_refresh_action)
 
         # Add actions to the toolbar
         self.toolbar.addAction(self.import_csv_action)
         self.toolbar.addAction(self.reload_action)
         self.toolbar.addAction(self.delete_point_action)
+        self.toolbar.addAction(self.delete_by_filter_action)
+        self.toolbar.addAction(self.edit_positions_action)
         self.toolbar.addAction(self.save_to_csv_action)
         self.toolbar.addAction(self.save_multiple_action)
+        self.toolbar.addAction(self.live_refresh_action)
 
         # Add actions to the list for unloading
-        self.actions = [self.import_csv_action, self.reload_action, self.delete_point_action, self.save_to_csv_action, self.save_multiple_action]
+        self.actions = [self.import_csv_action, self.reload_action, self.delete_point_action, self.delete_by_filter_action, self.edit_positions_action, self.save_to_csv_action, self.save_multiple_action, self.live_refresh_action]
+
+        self.live_refresh = LiveRefreshWatcher(self._live_reload, self.iface.mainWindow())
+
+        # Track edits on plugin layers, including ones restored from a project file
+        QgsProject.instance().layersAdded.connect(self._track_layers)
+        QgsProject.instance().layersRemoved.connect(self._layers_removed)
+
+        # Partially loaded layers follow the map view, once it settles
+        self._lazy_timer = QTimer(self.iface.mainWindow())
+        self._lazy_timer.setSingleShot(True)
+        self._lazy_timer.setInterval(300)
+        self._lazy_timer.timeout.connect(self._update_lazy_windows)
+        self.iface.mapCanvas().extentsChanged.connect(self._lazy_timer.start)
+        self._track_layers(QgsProject.instance().mapLayers().values())
+
+    def _track_layers(self, layers):
+        for layer in layers:
+            if layer.id() in self._tracked_layer_ids or not is_plugin_layer(layer):
+                continue
+            track_changes(layer)
+            self._tracked_layer_ids.add(layer.id())
+            if layer.customProperty(LIVE_REFRESH_PROPERTY, False) in (True, 'true'):
+                self.live_refresh.watch(layer)
 
     def unload(self):
+        for layer_id in list(self._tracked_layer_ids):
+            row_journal.detach(layer_id)
+        QgsProject.instance().layersAdded.disconnect(self._track_layers)
+        QgsProject.instance().layersRemoved.disconnect(self._layers_removed)
+        self.iface.mapCanvas().extentsChanged.disconnect(self._lazy_timer.start)
+        self._lazy_timer.stop()
+        for controller in self._lazy_layers.values():
+            controller.disconnect()
+        self._lazy_layers = {}
+        self.iface.currentLayerChanged.disconnect(self._update_live_refresh_action)
+        self.live_refresh.deleteLater()
+        self._pending_imports = []
+        for task in list(self._import_tasks) + self._index_tasks:
+            task.cancel()
         for action in self.actions:
             self.iface.removeToolBarIcon(action)
         if self.toolbar:
@@ -48,81 +119,170 @@ class EditableCSV:
     def import_csv(self):
         from .import_csv_dialog import ImportCsvDialog
         
-        file_names, _ = QFileDialog.getOpenFileNames(self.iface.mainWindow(), "Select CSV Files", "", "CSV Files (*.csv)")
+        file_names, _ = QFileDialog.getOpenFileNames(self.iface.mainWindow(), "Select CSV Files", "", FILE_FILTER)
         
         if not file_names:
             return # User cancelled
 
-        for file_path in file_names:
-            x_field = ''
-            y_field = ''
-            
-            try:
-                with open(file_path, 'r') as f:
-                    sniffer = csv.Sniffer()
-                    dialect = sniffer.sniff(f.read(1024))
-                    f.seek(0)
-                    delimiter = dialect.delimiter
-                    reader = csv.reader(f, dialect)
-                    header = next(reader)
-                    # Auto-select X and Y fields if present
-                    for field in header:
-                        if field.lower() == 'x':
-                            x_field = field
-                        if field.lower() == 'y':
-                            y_field = field
-            except Exception as e:
-                print(f"Error reading CSV header: {e}")
+        parallel = settings.value("parallel_import")
+        workers = max(1, settings.value("import_workers"))
+        # Each clock starts when its import does, not while a dialog is open
+        # or the import waits for a free worker
+        operations = [Operation("import", file_path, begin=False) for file_path in file_names]
+
+        # Header sniffing is independent per file, so do it for all of them at once
+        if parallel and len(file_names) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                sniffed = list(executor.map(_timed_sniff, operations))
+        else:
+            sniffed = [_timed_sniff(operation) for operation in operations]
 
-            if len(file_names) > 1 and x_field and y_field:
+        imports = []
+        for file_path, header_info, operation in zip(file_names, sniffed, operations):
+            if len(file_names) > 1 and header_info and header_info[2] and header_info[3]:
+                delimiter, _, x_field, y_field = header_info
                 options = {
                     "file_path": file_path,
                     "delimiter": delimiter,
                     "x_field": x_field,
                     "y_field": y_field,
-                    "detect_types": False,
+                    "detect_types": True,
+                    "lazy": is_large_file(file_path),
+                    "encoding": "utf-8",
                 }
             else:
                 dialog = ImportCsvDialog(self.iface.mainWindow())
                 dialog.file_edit.setText(file_path) # Pre-fill the file path
                 if not dialog.exec_():
+                    operation.finish("cancelled")
                     self.iface.messageBar().pushMessage("Info", f"Import of {os.path.basename(file_path)} cancelled.", level=Qgis.Info)
                     continue
                 options = dialog.get_options()
+            imports.append((options, operation))
 
-            delimiter = options["delimiter"]
-            x_field = options["x_field"]
-            y_field = options["y_field"]
-            detect_types = "yes" if options["detect_types"] else "no"
-
-            uri = f"file://{file_path}?delimiter={delimiter}&xField={x_field}&yField={y_field}&detectTypes={detect_types}"
-            source_layer = QgsVectorLayer(uri, "source_csv_temp", "delimitedtext")
+        chunk_size = settings.value("import_chunk_size")
+        if parallel:
+            self._pending_imports.extend(imports)
+            self._start_next_imports()
+            return
 
-            if not source_layer.isValid():
-                self.iface.messageBar().pushMessage("Error", f"Failed to read CSV file: {os.path.basename(file_path)}", level=Qgis.Critical)
+        for options, operation in imports:
+            operation.begin()
+            try:
+                mem_layer, lazy_index, fid_offsets = core.import_layer(options, chunk_size, operation=operation)
+            except Exception as e:
+                operation.finish("failed", str(e))
+                self.iface.messageBar().pushMessage("Error", f"Error importing {os.path.basename(options['file_path'])}: {e}", level=Qgis.Critical)
                 continue
-
-            layer_name = os.path.basename(file_path).replace('.csv', '')
-            crs = source_layer.crs().authid() if source_layer.crs().isValid() else "EPSG:4326"
-            mem_layer = QgsVectorLayer(f"Point?crs={crs}", layer_name, "memory")
-
-            mem_provider = mem_layer.dataProvider()
-            mem_provider.addAttributes(source_layer.fields())
-            mem_layer.updateFields()
-
-            mem_layer.startEditing()
-            for feature in source_layer.getFeatures():
-                mem_provider.addFeature(feature)
-            mem_layer.commitChanges()
-
-            mem_layer.setCustomProperty('original_delimiter', delimiter)
-            mem_layer.setCustomProperty('original_x_field', x_field)
-            mem_layer.setCustomProperty('original_y_field', y_field)
-            mem_layer.setCustomProperty('original_file_path', file_path)
-            mem_layer.setCustomProperty('detect_types', detect_types)
-
+            if mem_layer is None:
+                operation.finish("failed")
+                self.iface.messageBar().pushMessage("Error", f"Failed to read CSV file: {os.path.basename(options['file_path'])}", level=Qgis.Critical)
+                continue
+            self._add_imported_layer(mem_layer, lazy_index, fid_offsets, operation)
+
+    def _start_next_imports(self):
+        from .import_task import CsvImportTask
+
+        workers = max(1, settings.value("import_workers"))
+        chunk_size = settings.value("import_chunk_size")
+        while self._pending_imports and len(self._import_tasks) < workers:
+            options, operation = self._pending_imports.pop(0)
+            task = CsvImportTask(options, chunk_size, self._import_finished, operation)
+            self._import_tasks.append(task)
+            QgsApplication.taskManager().addTask(task)
+
+    def _import_finished(self, task, result):
+        self._import_tasks.remove(task)
+        file_name = os.path.basename(task.options['file_path'])
+        if result:
+            self._add_imported_layer(task.layer, task.lazy_index, task.fid_offsets, task.operation)
+        elif task.isCanceled():
+            task.operation.finish("cancelled")
+            self.iface.messageBar().pushMessage("Info", f"Import of {file_name} cancelled.", level=Qgis.Info)
+        elif task.error:
+            task.operation.finish("failed", task.error)
+            self.iface.messageBar().pushMessage("Error", f"Error importing {file_name}: {task.error}", level=Qgis.Critical)
+        else:
+            task.operation.finish("failed")
+            self.iface.messageBar().pushMessage("Error", f"Failed to read CSV file: {file_name}", level=Qgis.Critical)
+        self._start_next_imports()
+
+    def _lazy_schema_edited(self, layer):
+        self.iface.messageBar().pushMessage("Warning", f"Only part of '{layer.name()}' is loaded, so its columns cannot be added, deleted or renamed. Undo this change before saving the edits, or the layer can no longer be saved.", level=Qgis.Warning)
+
+    def _add_imported_layer(self, mem_layer, lazy_index=None, fid_offsets=None, operation=None):
+        if lazy_index is not None:
+            reader, (tiles, tile_size) = lazy_index
+            self._lazy_layers[mem_layer.id()] = LazyCsvLayer(mem_layer, reader, tiles, tile_size, self._lazy_schema_edited)
+        elif fid_offsets is not None and fid_offsets.base is not None:
+            row_journal.attach(mem_layer, fid_offsets, mem_layer.customProperty('original_x_field'), mem_layer.customProperty('original_y_field'))
+        with phase(operation, "addMapLayer") as timing:
+            timing["rows"] = mem_layer.featureCount()
             QgsProject.instance().addMapLayer(mem_layer)
-            self.iface.messageBar().pushMessage("Success", f"Layer '{layer_name}' added successfully as an editable layer.", level=Qgis.Success)
+        if lazy_index is not None:
+            self._update_lazy_windows()
+        if operation is not None:
+            operation.finish()
+        self.iface.messageBar().pushMessage("Success", f"Layer '{mem_layer.name()}' added successfully as an editable layer.", level=Qgis.Success)
+
+    def _update_lazy_windows(self):
+        canvas = self.iface.mapCanvas()
+        for controller in self._lazy_layers.values():
+            was_too_large = controller.window_too_large
+            extent = canvas.mapSettings().mapToLayerCoordinates(controller.layer, canvas.extent())
+            if not controller.update_window(extent) and not was_too_large:
+                self.iface.messageBar().pushMessage("Info", f"Zoom in to see the features of '{controller.layer.name()}'.", level=Qgis.Info)
+
+    def _layers_removed(self, layer_ids):
+        self.live_refresh.unwatch(layer_ids)
+        for layer_id in layer_ids:
+            row_journal.detach(layer_id)
+            controller = self._lazy_layers.pop(layer_id, None)
+            if controller is not None:
+                controller.disconnect()
+
+    def _write_layer(self, layer, file_path):
+        # Saves the layer and logs the timings of the save
+        operation = Operation("save", file_path)
+        controller = self._lazy_layers.get(layer.id())
+        try:
+            core.write_layer(layer, file_path, controller, operation)
+        except Exception as e:
+            operation.finish("failed", str(e))
+            raise
+        operation.finish()
+        if controller is not None:
+            if controller.tiles is None:
+                self._start_tile_index(controller)
+            self._update_lazy_windows()
+
+    def _start_tile_index(self, controller, operation=None):
+        from .import_task import TileIndexTask
+
+        task = TileIndexTask(controller.layer, controller.reader, self._tile_index_finished, operation)
+        self._index_tasks.append(task)
+        QgsApplication.taskManager().addTask(task)
+
+    def _tile_index_finished(self, task, result):
+        # `task.operation` is only set for a reload, which reports back here
+        self._index_tasks.remove(task)
+        controller = self._lazy_layers.get(task.layer_id)
+        if controller is None or controller.reader is not task.reader:
+            # The layer was removed, or reset again and handed to a newer task
+            if task.operation is not None:
+                task.operation.finish("cancelled")
+            return
+        if not result:
+            if task.operation is not None:
+                task.operation.finish("cancelled" if task.isCanceled() else "failed", task.error)
+            reason = f": {task.error}" if task.error else " because it was cancelled"
+            self.iface.messageBar().pushMessage("Warning", f"Indexing '{task.layer_name}' failed{reason}, so its features cannot be shown. Reload the layer to try again.", level=Qgis.Warning)
+            return
+        controller.set_index(*task.index)
+        self._update_lazy_windows()
+        if task.operation is not None:
+            task.operation.finish()
+            self.iface.messageBar().pushMessage("Success", f"Layer '{task.layer_name}' reloaded successfully.", level=Qgis.Success)
 
     
 
@@ -145,102 +305,265 @@ class EditableCSV:
             self.iface.messageBar().pushMessage("Info", "Reload cancelled.", level=Qgis.Info)
             return
 
-        original_delimiter = layer.customProperty('original_delimiter')
-        original_x_field = layer.customProperty('original_x_field')
-        original_y_field = layer.customProperty('original_y_field')
-        detect_types_str = layer.customProperty('detect_types', 'yes')
+        key_field = layer.customProperty(KEY_FIELD_PROPERTY)
+        if key_field is None:
+            key_field = self._ask_reload_key_field(layer)
+            if key_field is None:
+                self.iface.messageBar().pushMessage("Info", "Reload cancelled.", level=Qgis.Info)
+                return
+            layer.setCustomProperty(KEY_FIELD_PROPERTY, key_field)
+
+        self._reload_from_file(layer, key_field)
+
+    def _reload_from_file(self, layer, key_field):
+        operation = Operation("reload", layer.customProperty('original_file_path'))
+        controller = self._lazy_layers.get(layer.id())
+        if controller is not None:
+            if layer.isEditable():
+                layer.rollBack()
+            controller.reset()
+            set_modified(layer, False)
+            self._start_tile_index(controller, operation)
+            return
 
-        uri = f"file://{original_file_path}?delimiter={original_delimiter}&xField={original_x_field}&yField={original_y_field}&detectTypes={detect_types_str}"
-        source_layer = QgsVectorLayer(uri, "source_csv_temp_reload", "delimitedtext")
+        try:
+            added, removed, changed = core.reload_from_file(layer, key_field, operation=operation)
+        except ValueError as e:
+            operation.finish("failed", str(e))
+            self.iface.messageBar().pushMessage("Warning", str(e), level=Qgis.Warning)
+            return
+        operation.finish()
+        self.iface.mapCanvas().refresh()
+        self.iface.messageBar().pushMessage("Success", f"Layer '{layer.name()}' reloaded successfully: {added} added, {removed} removed, {changed} changed.", level=Qgis.Success)
 
-        if not source_layer.isValid():
-            self.iface.messageBar().pushMessage("Error", f"Failed to read original CSV file: {os.path.basename(original_file_path)}", level=Qgis.Critical)
+    def toggle_live_refresh(self, enabled):
+        layer = self.iface.activeLayer()
+        if not layer or not layer.customProperty('original_file_path'):
+            self.iface.messageBar().pushMessage("Warning", "Please select a layer imported by the Editable CSV plugin.", level=Qgis.Warning)
+            self.live_refresh_action.setChecked(False)
             return
 
-        if source_layer.fields().count() != layer.fields().count() or \
-           [f.name() for f in source_layer.fields()] != [f.name() for f in layer.fields()]:
-            self.iface.messageBar().pushMessage("Warning", "The schema of the source CSV file has changed. Reloading is not supported in this case.", level=Qgis.Warning)
+        if layer.id() in self._lazy_layers:
+            self.iface.messageBar().pushMessage("Warning", "Live refresh is not available for layers that only load features around the map view.", level=Qgis.Warning)
+            self.live_refresh_action.setChecked(False)
             return
 
-        layer.startEditing()
-        layer.deleteFeatures([f.id() for f in layer.getFeatures()])
-        
-        new_features = []
-        for f in source_layer.getFeatures():
-            new_feat = QgsFeature()
-            new_feat.setGeometry(f.geometry())
-            new_feat.setAttributes(f.attributes())
-            new_features.append(new_feat)
-            
-        layer.addFeatures(new_features)
-        layer.commitChanges()
-        self.iface.mapCanvas().refresh()
-        self.iface.messageBar().pushMessage("Success", f"Layer '{layer.name()}' reloaded successfully.", level=Qgis.Success)
+        layer.setCustomProperty(LIVE_REFRESH_PROPERTY, enabled)
+        if enabled:
+            self.live_refresh.watch(layer)
+            self.iface.messageBar().pushMessage("Info", f"Rows appended to {os.path.basename(layer.customProperty('original_file_path'))} will be added to '{layer.name()}' automatically.", level=Qgis.Info)
+        else:
+            self.live_refresh.unwatch([layer.id()])
+
+    def _update_live_refresh_action(self, layer):
+        self.live_refresh_action.setChecked(bool(layer) and self.live_refresh.is_watched(layer))
+
+    def _live_reload(self, layer):
+        # The file was truncated or rewritten, so appending is not enough.
+        # A reload would silently drop committed edits that are not saved yet.
+        if is_modified(layer):
+            self.iface.messageBar().pushMessage("Warning", f"{os.path.basename(layer.customProperty('original_file_path'))} was rewritten, but '{layer.name()}' has unsaved changes. Save or reload the layer yourself.", level=Qgis.Warning)
+            return
+        self._reload_from_file(layer, layer.customProperty(KEY_FIELD_PROPERTY) or '')
+
+    def _ask_reload_key_field(self, layer):
+        # Returns the chosen key column, '' to match rows by their contents,
+        # or None if the user cancelled.
+        match_by_contents = "(match rows by their contents)"
+        items = [match_by_contents] + [field.name() for field in layer.fields()]
+        item, ok = QInputDialog.getItem(self.iface.mainWindow(), 'Reload Layer',
+                                        "Column that uniquely identifies each row:", items, 0, False)
+        if not ok:
+            return None
+        return '' if item == match_by_contents else item
 
     
     def delete_point(self):
-        layer = self.iface.activeLayer()
+        layer = self._editable_active_layer()
         if not layer:
-            self.iface.messageBar().pushMessage("Warning", "Please select a layer.", level=Qgis.Warning)
             return
 
-        if not layer.isEditable():
-            self.iface.messageBar().pushMessage("Warning", "Please toggle editing on the selected layer first.", level=Qgis.Warning)
+        selected_ids = layer.selectedFeatureIds()
+        if not selected_ids:
+            self.iface.messageBar().pushMessage("Info", "No features selected to delete.", level=Qgis.Info)
             return
 
-        selected_features = layer.selectedFeatures()
-        if not selected_features:
-            self.iface.messageBar().pushMessage("Info", "No features selected to delete.", level=Qgis.Info)
+        self._confirm_and_delete(layer, selected_ids, f"{len(selected_ids)} selected feature(s)")
+
+    def delete_points_by_filter(self):
+        from qgis.gui import QgsExpressionBuilderDialog
+
+        layer = self._editable_active_layer()
+        if not layer:
+            return
+
+        by_expression = "Features matching an expression"
+        by_extent = "Features inside the current map view"
+        mode, ok = QInputDialog.getItem(self.iface.mainWindow(), 'Delete Features', "Delete:", [by_expression, by_extent], 0, False)
+        if not ok:
+            return
+
+        # Let QGIS find the matching ids through the selection so no feature
+        # is built in Python, then put the user's selection back
+        previous_selection = layer.selectedFeatureIds()
+        if mode == by_expression:
+            dialog = QgsExpressionBuilderDialog(layer, "", self.iface.mainWindow())
+            if not dialog.exec_():
+                return
+            expression = QgsExpression(dialog.expressionText())
+            if expression.hasParserError():
+                self.iface.messageBar().pushMessage("Error", f"Invalid expression: {expression.parserErrorString()}", level=Qgis.Critical)
+                return
+            layer.selectByExpression(expression.expression(), QgsVectorLayer.SetSelection)
+            description = "feature(s) matching the expression"
+        else:
+            canvas = self.iface.mapCanvas()
+            layer.selectByRect(canvas.mapSettings().mapToLayerCoordinates(layer, canvas.extent()), QgsVectorLayer.SetSelection)
+            description = "feature(s) inside the current map view"
+        fids = layer.selectedFeatureIds()
+        layer.selectByIds(previous_selection)
+
+        if not fids:
+            self.iface.messageBar().pushMessage("Info", "No features to delete.", level=Qgis.Info)
             return
+        self._confirm_and_delete(layer, fids, f"{len(fids)} {description}")
 
+    def _editable_active_layer(self):
+        layer = self.iface.activeLayer()
+        if not layer:
+            self.iface.messageBar().pushMessage("Warning", "Please select a layer.", level=Qgis.Warning)
+            return None
+
+        if not layer.isEditable():
+            self.iface.messageBar().pushMessage("Warning", "Please toggle editing on the selected layer first.", level=Qgis.Warning)
+            return None
+        return layer
+
+    def _confirm_and_delete(self, layer, fids, description):
         reply = QMessageBox.question(self.iface.mainWindow(), 'Delete Features', 
-                                     f"Are you sure you want to delete {len(selected_features)} selected feature(s)?",
+                                     f"Are you sure you want to delete {description}?",
                                      QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
 
-        if reply == QMessageBox.Yes:
-            layer.deleteFeatures([f.id() for f in selected_features])
-            self.iface.messageBar().pushMessage("Success", f"{len(selected_features)} feature(s) deleted.", level=Qgis.Success)
+        if reply != QMessageBox.Yes:
+            self.iface.messageBar().pushMessage("Info", "Deletion cancelled.", level=Qgis.Info)
+            return
+
+        if self._delete_in_chunks(layer, fids):
+            self.iface.messageBar().pushMessage("Success", f"{len(fids)} feature(s) deleted.", level=Qgis.Success)
         else:
             self.iface.messageBar().pushMessage("Info", "Deletion cancelled.", level=Qgis.Info)
 
+    def _delete_in_chunks(self, layer, fids):
+        # Deletes as one undoable edit command
+        fids = list(fids)
+        return self._edit_in_chunks(layer, f"Delete {len(fids)} feature(s)", "Deleting features...", fids, layer.deleteFeatures)
+
+    def _edit_in_chunks(self, layer, command_text, progress_text, items, apply_chunk):
+        # Calls apply_chunk with slices of `items` inside one undoable edit
+        # command. Large edits go in chunks behind a cancellable progress
+        # dialog; cancelling undoes them all.
+        chunk_size = max(1, settings.value("delete_chunk_size"))
+        progress = None
+        if len(items) > chunk_size:
+            progress = QProgressDialog(progress_text, "Cancel", 0, len(items), self.iface.mainWindow())
+            progress.setWindowModality(Qt.WindowModal)
+            progress.setMinimumDuration(0)
+
+        layer.beginEditCommand(command_text)
+        for start in range(0, len(items), chunk_size):
+            if progress is not None:
+                progress.setValue(start)
+                QCoreApplication.processEvents()
+                if progress.wasCanceled():
+                    layer.destroyEditCommand()
+                    return False
+            apply_chunk(items[start:start + chunk_size])
+        layer.endEditCommand()
+        if progress is not None:
+            progress.setValue(len(items))
+        return True
+
+    def edit_point_positions(self):
+        layer = self._editable_active_layer()
+        if not layer:
+            return
+
+        snap = "Snap points to a grid"
+        move = "Shift the selected points"
+        dedupe = "Remove duplicate points"
+        mode, ok = QInputDialog.getItem(self.iface.mainWindow(), 'Edit Point Positions', "Operation:", [snap, move, dedupe], 0, False)
+        if not ok:
+            return
+
+        selected = layer.selectedFeatureIds()
+        if mode == move and not selected:
+            self.iface.messageBar().pushMessage("Info", "No features selected to shift.", level=Qgis.Info)
+            return
+        # Without a selection, snapping and duplicate removal apply to the whole layer
+        scope = "selected" if selected else "all"
+        fids, xs, ys = geometry_ops.read_points(layer, selected or None)
+
+        if mode == dedupe:
+            tolerance, ok = QInputDialog.getDouble(self.iface.mainWindow(), 'Remove Duplicate Points',
+                                                   "Points closer than this distance (in layer units) to an earlier point are removed:",
+                                                   0.0, 0.0, 1e12, 8)
+            if not ok:
+                return
+            duplicates = geometry_ops.duplicate_fids(fids, xs, ys, tolerance)
+            if not duplicates:
+                self.iface.messageBar().pushMessage("Info", "No duplicate points found.", level=Qgis.Info)
+                return
+            self._confirm_and_delete(layer, duplicates, f"{len(duplicates)} duplicate point(s) among the {scope} features")
+            return
+
+        if mode == snap:
+            spacing, ok = QInputDialog.getDouble(self.iface.mainWindow(), 'Snap to Grid', "Grid spacing (in layer units):", 1.0, 1e-12, 1e12, 8)
+            if not ok:
+                return
+            new_xs, new_ys = geometry_ops.snap_to_grid(xs, ys, spacing)
+        else:
+            dx, ok = QInputDialog.getDouble(self.iface.mainWindow(), 'Shift Points', "Shift along X (in layer units):", 0.0, -1e12, 1e12, 8)
+            if not ok:
+                return
+            dy, ok = QInputDialog.getDouble(self.iface.mainWindow(), 'Shift Points', "Shift along Y (in layer units):", 0.0, -1e12, 1e12, 8)
+            if not ok:
+                return
+            new_xs, new_ys = geometry_ops.shift(xs, ys, dx, dy)
+
+        changes = list(geometry_ops.moved_geometries(fids, xs, ys, new_xs, new_ys).items())
+        if not changes:
+            self.iface.messageBar().pushMessage("Info", "No points needed to move.", level=Qgis.Info)
+            return
+
+        def change_geometries(chunk):
+            for fid, geometry in chunk:
+                layer.changeGeometry(fid, geometry)
+
+        if self._edit_in_chunks(layer, f"{mode} ({len(changes)} point(s))", "Moving points...", changes, change_geometries):
+            layer.triggerRepaint()
+            self.iface.messageBar().pushMessage("Success", f"{len(changes)} point(s) moved.", level=Qgis.Success)
+        else:
+            self.iface.messageBar().pushMessage("Info", "Edit cancelled.", level=Qgis.Info)
+
     
 
     def save_to_csv(self):
-        import csv
         layer = self.iface.activeLayer()
         if not layer:
             self.iface.messageBar().pushMessage("Warning", "Please select a layer to save.", level=Qgis.Warning)
             return
 
-        original_delimiter = layer.customProperty('original_delimiter')
-        original_x_field = layer.customProperty('original_x_field')
-        original_y_field = layer.customProperty('original_y_field')
         original_file_path = layer.customProperty('original_file_path', '') # Provide a default value
 
-        if not all([original_delimiter, original_x_field, original_y_field]):
+        if core.source_properties(layer) is None:
             self.iface.messageBar().pushMessage("Error", "Cannot save: Original CSV properties not found for this layer.", level=Qgis.Critical)
             return
 
-        file_name, _ = QFileDialog.getSaveFileName(self.iface.mainWindow(), "Save CSV File", original_file_path, "CSV Files (*.csv)")
+        file_name, _ = QFileDialog.getSaveFileName(self.iface.mainWindow(), "Save CSV File", original_file_path, FILE_FILTER)
         if file_name:
             try:
-                with open(file_name, 'w', newline='') as csvfile:
-                    writer = csv.writer(csvfile, delimiter=original_delimiter)
-
-                    fields = [field.name() for field in layer.fields()]
-                    writer.writerow(fields)
-
-                    for feature in layer.getFeatures():
-                        row = []
-                        for field_name in fields:
-                            if field_name == original_x_field:
-                                row.append(feature.geometry().asPoint().x())
-                            elif field_name == original_y_field:
-                                row.append(feature.geometry().asPoint().y())
-                            else:
-                                row.append(feature[field_name])
-                        writer.writerow(row)
-
+                self._write_layer(layer, file_name)
+                set_modified(layer, False)
                 self.iface.messageBar().pushMessage("Success", f"Layer saved to {file_name}", level=Qgis.Success)
             except Exception as e:
                 self.iface.messageBar().pushMessage("Error", f"Error saving CSV: {e}", level=Qgis.Critical)
@@ -250,61 +573,90 @@ class EditableCSV:
     def save_multiple_csvs(self):
         from .save_multiple_csv_dialog import SaveMultipleCsvDialog
         
-        plugin_layers = []
-        for layer_id in QgsProject.instance().mapLayers():
-            layer = QgsProject.instance().mapLayers()[layer_id]
-            if layer.customProperty('original_delimiter') and layer.customProperty('original_x_field'):
-                plugin_layers.append(layer)
+        layers = plugin_layers(QgsProject.instance())
         
-        if not plugin_layers:
+        if not layers:
             self.iface.messageBar().pushMessage("Info", "No editable CSV layers found in the project.", level=Qgis.Info)
             return
 
+        modified_layers = [layer for layer in layers if is_modified(layer)]
+        if not modified_layers:
+            self.iface.messageBar().pushMessage("Info", "None of the editable CSV layers have been modified since they were last saved.", level=Qgis.Info)
+            return
+
         dialog = SaveMultipleCsvDialog(self.iface.mainWindow())
         if dialog.exec_():
             folder_path = dialog.get_selected_folder()
             if folder_path:
-                for layer in plugin_layers:
+                targets = []
+                for layer in modified_layers:
                     # Get original filename from custom property
                     original_file_path = layer.customProperty('original_file_path')
                     if original_file_path:
                         file_name = os.path.basename(original_file_path)
-                        new_file_path = os.path.join(folder_path, file_name)
-                        self._save_single_layer_to_csv(layer, new_file_path)
                     else:
                         # Fallback to layer name if original path not found
                         file_name = f"{layer.name()}.csv"
-                        new_file_path = os.path.join(folder_path, file_name)
+                    targets.append((layer, os.path.join(folder_path, file_name)))
+
+                if not settings.value("parallel_export"):
+                    for layer, new_file_path in targets:
                         self._save_single_layer_to_csv(layer, new_file_path)
+                    return
+                self._start_export_tasks(targets)
 
-    def _save_single_layer_to_csv(self, layer, file_path):
-        import csv
-        original_delimiter = layer.customProperty('original_delimiter')
-        original_x_field = layer.customProperty('original_x_field')
-        original_y_field = layer.customProperty('original_y_field')
+    def _start_export_tasks(self, targets):
+        from .export_task import CsvExportBatchTask, CsvExportTask
+
+        export_tasks = []
+        for layer, file_path in targets:
+            if layer.id() in self._lazy_layers or core.can_patch_source(layer, file_path):
+                # Patching the source file is bound by I/O, so it is done right away
+                self._save_single_layer_to_csv(layer, file_path)
+                continue
+            if core.source_properties(layer) is None:
+                self.iface.messageBar().pushMessage("Error", f"Cannot save layer {layer.name()}: Original CSV properties not found.", level=Qgis.Critical)
+                continue
+            export_tasks.append(CsvExportTask(layer, file_path, self._export_finished))
+            # The task writes a snapshot of the layer as it is now. Edits
+            # committed while it runs set the flag again, so the next save
+            # still picks the layer up.
+            set_modified(layer, False)
+        if not export_tasks:
+            return
+
+        batch = CsvExportBatchTask(export_tasks, self._export_batch_finished)
+        # Keep the Python wrappers alive until the task manager is done with them
+        self._export_batches.append(batch)
+        QgsApplication.taskManager().addTask(batch)
 
-        if not all([original_delimiter, original_x_field, original_y_field]):
+    def _export_finished(self, task, result):
+        layer = QgsProject.instance().mapLayer(task.layer_id)
+        if result:
+            if layer is not None:
+                core.layer_written(layer, task.file_path)
+            return
+        if layer is not None:
+            set_modified(layer, True)
+        if task.error:
+            self.iface.messageBar().pushMessage("Error", f"Error saving layer {task.layer_name} to CSV: {task.error}", level=Qgis.Critical)
+
+    def _export_batch_finished(self, batch, result):
+        self._export_batches.remove(batch)
+        saved = [task for task in batch.export_tasks if task.error is None and not task.isCanceled()]
+        if len(saved) == len(batch.export_tasks):
+            self.iface.messageBar().pushMessage("Success", f"{len(saved)} modified layer(s) saved.", level=Qgis.Success)
+        else:
+            self.iface.messageBar().pushMessage("Warning", f"{len(saved)} of {len(batch.export_tasks)} modified layer(s) saved.", level=Qgis.Warning)
+
+    def _save_single_layer_to_csv(self, layer, file_path):
+        if core.source_properties(layer) is None:
             self.iface.messageBar().pushMessage("Error", f"Cannot save layer {layer.name()}: Original CSV properties not found.", level=Qgis.Critical)
             return
 
         try:
-            with open(file_path, 'w', newline='') as csvfile:
-                writer = csv.writer(csvfile, delimiter=original_delimiter)
-
-                fields = [field.name() for field in layer.fields()]
-                writer.writerow(fields)
-
-                for feature in layer.getFeatures():
-                    row = []
-                    for field_name in fields:
-                        if field_name == original_x_field:
-                            row.append(feature.geometry().asPoint().x())
-                        elif field_name == original_y_field:
-                            row.append(feature.geometry().asPoint().y())
-                        else:
-                            row.append(feature[field_name])
-                    writer.writerow(row)
-
+            self._write_layer(layer, file_path)
+            set_modified(layer, False)
             self.iface.messageBar().pushMessage("Success", f"Layer '{layer.name()}' saved to {file_path}", level=Qgis.Success)
         except Exception as e:
             self.iface.messageBar().pushMessage("Error", f"Error saving layer {layer.name()} to CSV: {e}", level=Qgis.Critical)
@@ -0,0 +1,65 @@
+import os.path
+
+from qgis.core import QgsTask, QgsVectorLayerFeatureSource
+
+from .csv_reader import source_delimiter, source_encoding
+from .csv_writer import write_features_csv
+from .instrumentation import Operation
+
+
+class CsvExportTask(QgsTask):
+    # Writes one layer to CSV off the GUI thread. Everything read from the
+    # layer is captured in the constructor, which runs on the main thread.
+    def __init__(self, layer, file_path, on_finished):
+        super().__init__(f"Saving {layer.name()}", QgsTask.CanCancel)
+        self.layer_id = layer.id()
+        self.layer_name = layer.name()
+        self.file_path = file_path
+        self.on_finished = on_finished
+        self.source = QgsVectorLayerFeatureSource(layer)
+        self.fields = layer.fields()
+        self.total = layer.featureCount()
+        self.delimiter = source_delimiter(layer)
+        self.encoding = source_encoding(layer)
+        self.x_field = layer.customProperty('original_x_field')
+        self.y_field = layer.customProperty('original_y_field')
+        self.error = None
+        self.operation = Operation("save", file_path, begin=False)
+
+    def run(self):
+        self.operation.begin()
+        try:
+            with self.operation.phase("export write") as timing:
+                timing["rows"] = write_features_csv(self.source, self.fields, self.file_path, self.delimiter,
+                                                    self.x_field, self.y_field, feedback=self, total=self.total,
+                                                    encoding=self.encoding)
+                if not self.isCanceled():
+                    timing["bytes"] = os.path.getsize(self.file_path)
+        except Exception as e:
+            self.error = str(e)
+            return False
+        return not self.isCanceled()
+
+    def finished(self, result):
+        if self.isCanceled():
+            self.operation.finish("cancelled")
+        else:
+            self.operation.finish("ok" if result else "failed", self.error)
+        self.on_finished(self, result)
+
+
+class CsvExportBatchTask(QgsTask):
+    # Parent of one CsvExportTask per layer. The subtasks run in parallel and
+    # the task manager shows their averaged progress on this task.
+    def __init__(self, export_tasks, on_finished):
+        super().__init__(f"Saving {len(export_tasks)} CSV layer(s)", QgsTask.CanCancel)
+        self.export_tasks = export_tasks
+        self.on_finished = on_finished
+        for task in export_tasks:
+            self.addSubTask(task)
+
+    def run(self):
+        return True
+
+    def finished(self, result):
+        self.on_finished(self, result)
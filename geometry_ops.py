@@ -0,0 +1,83 @@
+from array import array
+from math import floor
+
+from qgis.core import QgsFeatureRequest, QgsGeometry, QgsPointXY
+
+# Bulk edits of point positions. Coordinates are read once into flat arrays,
+# transformed there, and only the points that actually move are handed back
+# as geometries to write.
+
+
+def read_points(layer, fids=None):
+    # (fids, xs, ys) of the layer's points, or only of `fids`. Features
+    # without a geometry are left out.
+    request = QgsFeatureRequest()
+    request.setSubsetOfAttributes([])
+    if fids is not None:
+        request.setFilterFids(list(fids))
+    point_fids = array('q')
+    xs = array('d')
+    ys = array('d')
+    for feature in layer.getFeatures(request):
+        geometry = feature.geometry()
+        if geometry.isNull():
+            continue
+        point = geometry.asPoint()
+        point_fids.append(feature.id())
+        xs.append(point.x())
+        ys.append(point.y())
+    return point_fids, xs, ys
+
+
+def snap_to_grid(xs, ys, spacing):
+    # Rounds every coordinate to the nearest multiple of `spacing`
+    if spacing <= 0:
+        raise ValueError("The grid spacing must be greater than zero.")
+    return (array('d', (round(x / spacing) * spacing for x in xs)),
+            array('d', (round(y / spacing) * spacing for y in ys)))
+
+
+def shift(xs, ys, dx, dy):
+    return array('d', (x + dx for x in xs)), array('d', (y + dy for y in ys))
+
+
+def moved_geometries(fids, xs, ys, new_xs, new_ys):
+    # {fid: geometry} for the points whose position changed
+    return {fid: QgsGeometry.fromPointXY(QgsPointXY(new_x, new_y))
+            for fid, x, y, new_x, new_y in zip(fids, xs, ys, new_xs, new_ys)
+            if x != new_x or y != new_y}
+
+
+def duplicate_fids(fids, xs, ys, tolerance):
+    # Fids of the points lying within `tolerance` of an earlier point, which
+    # is kept. Points are bucketed on a grid of cells `tolerance` wide, so
+    # each one is only compared with the kept points of the nine cells
+    # around it.
+    duplicates = []
+    if tolerance <= 0:
+        seen = set()
+        for fid, x, y in zip(fids, xs, ys):
+            if (x, y) in seen:
+                duplicates.append(fid)
+            else:
+                seen.add((x, y))
+        return duplicates
+
+    squared = tolerance * tolerance
+    cells = {}
+    for fid, x, y in zip(fids, xs, ys):
+        cx, cy = floor(x / tolerance), floor(y / tolerance)
+        if _near_kept_point(cells, cx, cy, x, y, squared):
+            duplicates.append(fid)
+        else:
+            cells.setdefault((cx, cy), []).append((x, y))
+    return duplicates
+
+
+def _near_kept_point(cells, cx, cy, x, y, squared):
+    for nx in (cx - 1, cx, cx + 1):
+        for ny in (cy - 1, cy, cy + 1):
+            for kx, ky in cells.get((nx, ny), ()):
+                if (kx - x) * (kx - x) + (ky - y) * (ky - y) <= squared:
+                    return True
+    return False
@@ -1,5 +1,12 @@
+from qgis.core import Qgis
 from PyQt5.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton, QComboBox, QFileDialog, QCheckBox
-import csv
+import os.path
+
+from .compressed_io import ENCODINGS, FILE_FILTER, compression_of
+from .csv_metadata import file_info
+from .csv_reader import decode_delimiter, encode_delimiter
+from .instrumentation import log_message
+from .lazy_layer import is_large_file
 
 class ImportCsvDialog(QDialog):
     def __init__(self, parent=None):
@@ -22,11 +29,23 @@ class ImportCsvDialog(QDialog):
         self.delimiter_layout = QHBoxLayout()
         self.delimiter_label = QLabel("Delimiter:")
         self.delimiter_combo = QComboBox()
-        self.delimiter_combo.addItems([",", ";"])
+        # Editable for other delimiters; a tab is entered as \t
+        self.delimiter_combo.setEditable(True)
+        self.delimiter_combo.addItems([",", ";", encode_delimiter("\t"), "|"])
         self.delimiter_layout.addWidget(self.delimiter_label)
         self.delimiter_layout.addWidget(self.delimiter_combo)
         self.layout.addLayout(self.delimiter_layout)
 
+        # Encoding
+        self.encoding_layout = QHBoxLayout()
+        self.encoding_label = QLabel("Encoding:")
+        self.encoding_combo = QComboBox()
+        self.encoding_combo.setEditable(True)
+        self.encoding_combo.addItems(ENCODINGS)
+        self.encoding_layout.addWidget(self.encoding_label)
+        self.encoding_layout.addWidget(self.encoding_combo)
+        self.layout.addLayout(self.encoding_layout)
+
         # X and Y fields
         self.x_layout = QHBoxLayout()
         self.x_label = QLabel("X Field:")
@@ -44,9 +63,14 @@ class ImportCsvDialog(QDialog):
 
         # Detect types checkbox
         self.detect_types_checkbox = QCheckBox("Detect field types")
-        self.detect_types_checkbox.setChecked(False)
+        self.detect_types_checkbox.setChecked(True)
         self.layout.addWidget(self.detect_types_checkbox)
 
+        # Lazy loading for files too large to hold in memory
+        self.lazy_checkbox = QCheckBox("Only load features around the map view (for very large files)")
+        self.lazy_checkbox.setChecked(False)
+        self.layout.addWidget(self.lazy_checkbox)
+
         # Buttons
         self.button_layout = QHBoxLayout()
         self.ok_button = QPushButton("OK")
@@ -58,41 +82,44 @@ class ImportCsvDialog(QDialog):
         self.layout.addLayout(self.button_layout)
 
         self.file_edit.textChanged.connect(self.update_fields)
+        self.encoding_combo.currentTextChanged.connect(lambda _: self.update_fields(self.file_edit.text()))
 
     def select_file(self):
-        file_name, _ = QFileDialog.getOpenFileName(self, "Select CSV File", "", "CSV Files (*.csv)")
+        file_name, _ = QFileDialog.getOpenFileName(self, "Select CSV File", "", FILE_FILTER)
         if file_name:
             self.file_edit.setText(file_name)
 
     def update_fields(self, file_name):
-        if file_name:
+        # Called on every keystroke, so only look at paths that exist
+        if file_name and os.path.isfile(file_name):
+            # Compressed files cannot be read at random offsets
+            self.lazy_checkbox.setEnabled(not compression_of(file_name))
+            self.lazy_checkbox.setChecked(is_large_file(file_name))
             try:
-                with open(file_name, 'r') as f:
-                    sniffer = csv.Sniffer()
-                    dialect = sniffer.sniff(f.read(1024))
-                    f.seek(0)
-                    self.delimiter_combo.setCurrentText(dialect.delimiter)
-                    reader = csv.reader(f, dialect)
-                    header = next(reader)
-                    self.x_combo.clear()
-                    self.y_combo.clear()
-                    self.x_combo.addItems(header)
-                    self.y_combo.addItems(header)
+                info = file_info(file_name, self.encoding_combo.currentText())
+                self.delimiter_combo.setCurrentText(encode_delimiter(info.delimiter))
+                header = info.header
+                self.x_combo.clear()
+                self.y_combo.clear()
+                self.x_combo.addItems(header)
+                self.y_combo.addItems(header)
 
-                    # Auto-select X and Y fields if present
-                    for field in header:
-                        if field.lower() == 'x':
-                            self.x_combo.setCurrentText(field)
-                        if field.lower() == 'y':
-                            self.y_combo.setCurrentText(field)
+                # Auto-select X and Y fields if present
+                for field in header:
+                    if field.lower() == 'x':
+                        self.x_combo.setCurrentText(field)
+                    if field.lower() == 'y':
+                        self.y_combo.setCurrentText(field)
             except Exception as e:
-                print(f"Error reading CSV header: {e}")
+                log_message(f"Error reading CSV header of {file_name}: {e}", Qgis.Warning)
 
     def get_options(self):
         return {
             "file_path": self.file_edit.text(),
-            "delimiter": self.delimiter_combo.currentText(),
+            "delimiter": decode_delimiter(self.delimiter_combo.currentText()),
             "x_field": self.x_combo.currentText(),
             "y_field": self.y_combo.currentText(),
             "detect_types": self.detect_types_checkbox.isChecked(),
+            "lazy": self.lazy_checkbox.isChecked() and self.lazy_checkbox.isEnabled(),
+            "encoding": self.encoding_combo.currentText(),
         }
\ No newline at end of file
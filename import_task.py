@@ -0,0 +1,71 @@
+import os.path
+
+from qgis.core import QgsApplication, QgsTask
+
+from .core import import_layer
+from .instrumentation import phase
+from .lazy_layer import build_tile_index
+
+
+class CsvImportTask(QgsTask):
+    # Parses one CSV into a memory layer off the GUI thread. The layer is
+    # handed back to the main thread in finished(), where on_finished adds it
+    # to the project. `operation` is the instrumentation.Operation the import
+    # phases are timed on; on_finished is expected to finish it.
+    def __init__(self, options, chunk_size, on_finished, operation=None):
+        super().__init__(f"Importing {os.path.basename(options['file_path'])}", QgsTask.CanCancel)
+        self.options = options
+        self.chunk_size = chunk_size
+        self.on_finished = on_finished
+        self.layer = None
+        self.lazy_index = None
+        self.fid_offsets = None
+        self.error = None
+        self.operation = operation
+
+    def run(self):
+        if self.operation is not None:
+            self.operation.begin()
+        try:
+            layer, self.lazy_index, self.fid_offsets = import_layer(self.options, self.chunk_size, feedback=self,
+                                                                      operation=self.operation)
+        except Exception as e:
+            self.error = str(e)
+            return False
+        if layer is None:
+            return False
+        layer.moveToThread(QgsApplication.instance().thread())
+        self.layer = layer
+        return True
+
+    def finished(self, result):
+        self.on_finished(self, result)
+
+
+class TileIndexTask(QgsTask):
+    # Indexes the file of a LazyCsvLayer again after reset(), off the GUI
+    # thread. `reader` is the controller's reader at the time, so on_finished
+    # can tell whether the controller was reset again meanwhile. Indexing is
+    # timed as the "feature copy" phase of `operation`, if given.
+    def __init__(self, layer, reader, on_finished, operation=None):
+        super().__init__(f"Indexing {layer.name()}", QgsTask.CanCancel)
+        self.layer_id = layer.id()
+        self.layer_name = layer.name()
+        self.reader = reader
+        self.on_finished = on_finished
+        self.operation = operation
+        self.index = None
+        self.error = None
+
+    def run(self):
+        try:
+            with phase(self.operation, "feature copy") as timing:
+                self.index = build_tile_index(self.reader, feedback=self)
+                timing["bytes"] = self.reader.end_offset
+        except Exception as e:
+            self.error = str(e)
+            return False
+        return self.index is not None
+
+    def finished(self, result):
+        self.on_finished(self, result)
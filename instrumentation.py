@@ -0,0 +1,185 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+from qgis.core import Qgis, QgsMessageLog
+
+from . import settings
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+LOG_TAG = "Editable CSV"
+PROFILE_TOP_ENTRIES = 25
+
+_profile_lock = threading.Lock()
+_profiling = False
+
+
+def log_message(message, level=Qgis.Info):
+    QgsMessageLog.logMessage(message, LOG_TAG, level)
+
+
+def peak_rss_mib():
+    # Peak resident set size of the process so far, or None where unknown.
+    # ru_maxrss is in KiB on Linux and bytes on macOS.
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+class Operation:
+    # Timings of one user-level operation (an import, reload or save of one
+    # layer), split into named phases. finish() writes it to the QGIS log as
+    # one JSON record, and to a file when the timings_dir setting is set.
+    # Phases may be timed from a worker thread, but not concurrently.
+    #
+    # With begin=False the clock only starts at begin(), so time spent in a
+    # dialog or waiting for a free worker is not counted. Phases timed
+    # before that, such as sniffing, are added to the total.
+    def __init__(self, kind, target, begin=True):
+        self.kind = kind
+        self.target = target
+        self.started = datetime.now()
+        self.start = None
+        self.phases = []
+        self.rows = 0
+        self.bytes = 0
+        self.finished = False
+        self._profiler = None
+        if begin:
+            self.begin()
+
+    def begin(self):
+        # Starts the clock, and the profiler when it is due; later calls do
+        # nothing
+        if self.start is not None:
+            return
+        self.started = datetime.now()
+        self.start = time.perf_counter()
+        self._seconds_before = sum(phase["seconds"] for phase in self.phases)
+        self._claim_profiling()
+
+    def seconds(self):
+        if self.start is None:
+            return sum(phase["seconds"] for phase in self.phases)
+        return self._seconds_before + time.perf_counter() - self.start
+
+    def _claim_profiling(self):
+        # The profile_next_operation debug setting applies to the first
+        # operation started after it was turned on
+        global _profiling
+        if not settings.value("profile_next_operation"):
+            return
+        with _profile_lock:
+            if _profiling or not settings.value("profile_next_operation"):
+                return
+            _profiling = True
+            settings.set_value("profile_next_operation", False)
+        self._profiler = cProfile.Profile()
+        tracemalloc.start()
+
+    @contextmanager
+    def phase(self, name):
+        # Times the block; the caller fills in the "rows" and "bytes" of the
+        # yielded dict if they are known.
+        record = {"name": name, "rows": None, "bytes": None}
+        if self._profiler is not None:
+            self._profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = round(time.perf_counter() - start, 6)
+            if self._profiler is not None:
+                self._profiler.disable()
+            record["peak_rss_mib"] = peak_rss_mib()
+            self.phases.append(record)
+            self.rows = max(self.rows, record["rows"] or 0)
+            self.bytes = max(self.bytes, record["bytes"] or 0)
+
+    def record(self, status="ok", error=None):
+        return {
+            "operation": self.kind,
+            "target": self.target,
+            "started": self.started.isoformat(timespec="seconds"),
+            "seconds": round(self.seconds(), 6),
+            "status": status,
+            "error": error,
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "peak_rss_mib": peak_rss_mib(),
+            "phases": self.phases,
+        }
+
+    def finish(self, status="ok", error=None):
+        # Returns the record, or None if it was already written
+        if self.finished:
+            return None
+        self.finished = True
+        record = self.record(status, error)
+        if self._profiler is not None:
+            record["profile"] = self._finish_profiling()
+        if settings.value("log_timings"):
+            log_message(json.dumps(record), Qgis.Info if status == "ok" else Qgis.Warning)
+        timings_dir = settings.value("timings_dir")
+        if timings_dir:
+            try:
+                os.makedirs(timings_dir, exist_ok=True)
+                with open(os.path.join(timings_dir, self._file_name(".json")), "w") as f:
+                    json.dump(record, f, indent=2)
+            except OSError as e:
+                log_message(f"Could not write timings to {timings_dir}: {e}", Qgis.Warning)
+        return record
+
+    def _file_name(self, extension):
+        name = os.path.basename(self.target or "") or "layer"
+        return f"{self.started:%Y%m%d-%H%M%S-%f}-{self.kind}-{name}{extension}"
+
+    def _finish_profiling(self):
+        # Saves the cProfile stats next to the timings and returns a summary
+        # of them and of the largest allocations made during the operation
+        global _profiling
+        snapshot = tracemalloc.take_snapshot()
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        with _profile_lock:
+            _profiling = False
+
+        profile_dir = settings.value("timings_dir") or tempfile.gettempdir()
+        profile_path = os.path.join(profile_dir, self._file_name(".prof"))
+        try:
+            os.makedirs(profile_dir, exist_ok=True)
+            self._profiler.dump_stats(profile_path)
+        except OSError:
+            profile_path = None
+        text = io.StringIO()
+        pstats.Stats(self._profiler, stream=text).sort_stats("cumulative").print_stats(PROFILE_TOP_ENTRIES)
+        log_message(text.getvalue())
+        return {
+            "stats_file": profile_path,
+            "traced_peak_mib": round(traced_peak / (1024 * 1024), 1),
+            "top_allocations": [str(stat) for stat in snapshot.statistics("lineno")[:PROFILE_TOP_ENTRIES]],
+        }
+
+
+@contextmanager
+def phase(operation, name):
+    # Operation.phase for code that may run without an operation
+    if operation is None:
+        yield {"name": name, "rows": None, "bytes": None}
+        return
+    with operation.phase(name) as record:
+        yield record
@@ -0,0 +1,96 @@
+from collections import deque
+
+from qgis.core import NULL, QgsGeometry
+
+from .instrumentation import phase
+
+KEY_FIELD_PROPERTY = 'reload_key_field'
+
+
+def _hashable(attributes):
+    return tuple(None if value == NULL else value for value in attributes)
+
+
+def _point(feature):
+    geometry = feature.geometry()
+    if geometry.isNull():
+        return None
+    point = geometry.asPoint()
+    return point.x(), point.y()
+
+
+def _row_key(attributes, point, key_index):
+    # Without a key column a row is identified by its full contents, so a
+    # changed row shows up as one delete plus one insert.
+    if key_index < 0:
+        return _hashable(attributes), point
+    value = attributes[key_index]
+    return None if value == NULL else value
+
+
+def diff_layer(layer, reader, key_field, chunk_size):
+    # Returns (inserts, deletes, attribute_changes, geometry_changes) needed to
+    # turn the layer's committed features into the rows the reader yields.
+    key_index = layer.fields().indexOf(key_field) if key_field else -1
+
+    existing = {}
+    for feature in layer.dataProvider().getFeatures():
+        attributes = feature.attributes()
+        point = _point(feature)
+        # Rows with the same key are paired in file order
+        existing.setdefault(_row_key(attributes, point, key_index), deque()).append((feature.id(), attributes, point))
+
+    inserts = []
+    attribute_changes = {}
+    geometry_changes = {}
+    for chunk in reader.feature_chunks(chunk_size):
+        for feature in chunk:
+            attributes = feature.attributes()
+            point = _point(feature)
+            key = _row_key(attributes, point, key_index)
+            candidates = existing.get(key)
+            if not candidates:
+                inserts.append(feature)
+                continue
+            fid, old_attributes, old_point = candidates.popleft()
+            if not candidates:
+                del existing[key]
+            if key_index < 0:
+                continue
+            changed = {i: value for i, (value, old_value) in enumerate(zip(attributes, old_attributes)) if value != old_value}
+            if changed:
+                attribute_changes[fid] = changed
+            if point != old_point:
+                geometry_changes[fid] = feature.geometry()
+
+    deletes = [fid for candidates in existing.values() for fid, _, _ in candidates]
+    return inserts, deletes, attribute_changes, geometry_changes
+
+
+def reload_layer(layer, reader, key_field, chunk_size, operation=None):
+    # Applies only the differences between the layer and its file, so feature
+    # IDs of unchanged and updated rows, and with them the selection and the
+    # attribute table position, survive the reload. Pending edits are discarded.
+    if layer.isEditable():
+        layer.rollBack()
+
+    with phase(operation, "feature copy") as timing:
+        inserts, deletes, attribute_changes, geometry_changes = diff_layer(layer, reader, key_field, chunk_size)
+        timing["rows"] = layer.dataProvider().featureCount() - len(deletes) + len(inserts)
+        timing["bytes"] = reader.end_offset
+    if not (inserts or deletes or attribute_changes or geometry_changes):
+        return 0, 0, 0
+
+    with phase(operation, "commit") as timing:
+        layer.startEditing()
+        for fid, values in attribute_changes.items():
+            layer.changeAttributeValues(fid, values)
+        for fid, geometry in geometry_changes.items():
+            layer.changeGeometry(fid, QgsGeometry(geometry))
+        if deletes:
+            layer.deleteFeatures(deletes)
+        if inserts:
+            layer.addFeatures(inserts)
+        layer.commitChanges()
+        timing["rows"] = len(inserts) + len(deletes) + len(set(attribute_changes) | set(geometry_changes))
+    return len(inserts), len(deletes), len(set(attribute_changes) | set(geometry_changes))
@@ -0,0 +1,34 @@
+MODIFIED_PROPERTY = 'csv_modified'
+
+# Committed edits of any kind make the layer differ from its CSV file
+_CHANGE_SIGNALS = (
+    'committedFeaturesAdded',
+    'committedFeaturesRemoved',
+    'committedAttributeValuesChanges',
+    'committedGeometriesChanges',
+    'committedAttributesAdded',
+    'committedAttributesDeleted',
+)
+
+
+def is_plugin_layer(layer):
+    return bool(layer.customProperty('original_delimiter') and layer.customProperty('original_x_field'))
+
+
+def plugin_layers(project):
+    return [layer for layer in project.mapLayers().values() if is_plugin_layer(layer)]
+
+
+def set_modified(layer, modified):
+    layer.setCustomProperty(MODIFIED_PROPERTY, bool(modified))
+
+
+def is_modified(layer):
+    # Uncommitted edits count too, since the exporter reads through the edit buffer
+    modified = layer.customProperty(MODIFIED_PROPERTY, False)
+    return modified in (True, 'true') or layer.isModified()
+
+
+def track_changes(layer):
+    for name in _CHANGE_SIGNALS:
+        getattr(layer, name).connect(lambda *args, layer=layer: set_modified(layer, True))
@@ -0,0 +1,274 @@
+import os
+from array import array
+from math import floor
+
+from qgis.core import Qgis, QgsRectangle, QgsVectorLayer
+
+from . import settings
+from .compressed_io import compression_of
+from .instrumentation import log_message, phase
+from .csv_reader import ENGINE_NATIVE, NativeReader, create_spatial_index, layer_name_for, open_reader, set_source_properties
+from .row_journal import RowJournal
+from .type_inference import TypeMismatch, serialize
+
+LAZY_PROPERTY = 'lazy_import'
+
+
+def is_large_file(file_path):
+    # Compressed files cannot be read at random offsets, so they never qualify
+    threshold = settings.value("lazy_threshold_mb")
+    return (threshold > 0 and not compression_of(file_path)
+            and os.path.getsize(file_path) >= threshold * 1024 * 1024)
+
+
+# Tiles start this small and double until the points span at most
+# editable_csv/lazy_tiles_across of them. Their sizes are powers of two, so
+# shifting a tile key right gives exactly the key of the larger tile.
+_MIN_TILE_EXPONENT = -30
+
+
+def tile_of(x, y, tile_size):
+    return floor(x / tile_size), floor(y / tile_size)
+
+
+def _merge_tiles(tiles, shift):
+    merged = {}
+    for (x, y), offsets in tiles.items():
+        key = x >> shift, y >> shift
+        existing = merged.get(key)
+        if existing is None:
+            merged[key] = offsets
+        else:
+            existing.extend(offsets)
+    return merged
+
+
+def _span(bounds, shift):
+    x0, y0, x1, y1 = bounds
+    return max((x1 >> shift) - (x0 >> shift), (y1 >> shift) - (y0 >> shift)) + 1
+
+
+def _check_types(reader, row):
+    # Makes the reader read as text every typed column this row has a value
+    # of another type in
+    width = len(reader.header)
+    row = (row + [None] * width)[:width]
+    while True:
+        try:
+            reader.convert_row(row)
+            return
+        except TypeMismatch as e:
+            log_message(f"{e}; reading it as text", Qgis.Info)
+            reader.read_as_text(e.column)
+
+
+def build_tile_index(reader, feedback=None, check_types=False):
+    # One streaming pass over the file collecting, per tile, the byte offsets
+    # of the rows whose point falls in it. Only offsets are kept in memory.
+    # Returns (tiles, tile_size), or None if cancelled through `feedback`.
+    # The tile size follows the extent of the points, whatever their units.
+    # With `check_types` every row is also converted, so the reader ends up
+    # with types all rows parse as.
+    tiles = {}
+    tiles_across = max(settings.value("lazy_tiles_across"), 1)
+    exponent = _MIN_TILE_EXPONENT
+    tile_size = 2.0 ** exponent
+    bounds = None
+    x_index = reader.header.index(reader.x_field)
+    y_index = reader.header.index(reader.y_field)
+    total = max(os.path.getsize(reader.file_path), 1)
+    for count, (offset, row) in enumerate(reader.iter_rows()):
+        try:
+            key = tile_of(float(row[x_index]), float(row[y_index]), tile_size)
+        except (IndexError, TypeError, ValueError, OverflowError):
+            continue
+        if check_types:
+            _check_types(reader, row)
+        offsets = tiles.get(key)
+        if offsets is None:
+            # Only a new tile can widen the extent
+            x, y = key
+            if bounds is None:
+                bounds = (x, y, x, y)
+            else:
+                bounds = (min(bounds[0], x), min(bounds[1], y), max(bounds[2], x), max(bounds[3], y))
+            shift = 0
+            while _span(bounds, shift) > tiles_across:
+                shift += 1
+            if shift:
+                tiles = _merge_tiles(tiles, shift)
+                bounds = tuple(b >> shift for b in bounds)
+                key = x >> shift, y >> shift
+                exponent += shift
+                tile_size = 2.0 ** exponent
+                offsets = tiles.get(key)
+            if offsets is None:
+                offsets = tiles[key] = array('q')
+        offsets.append(offset)
+        if feedback is not None and count % 100000 == 0:
+            if feedback.isCanceled():
+                return None
+            feedback.setProgress(reader.end_offset / total * 100)
+    return tiles, tile_size
+
+
+def build_lazy_layer(options, feedback=None, operation=None):
+    # Returns (layer, reader, (tiles, tile_size)) for an empty memory layer whose features
+    # are loaded later by a LazyCsvLayer, or None if the file cannot be read
+    # or the import was cancelled. Indexing is timed as the "feature copy"
+    # phase of `operation`.
+    file_path = options["file_path"]
+    detect_types = "yes" if options["detect_types"] else "no"
+    with phase(operation, "provider open"):
+        reader = open_reader(file_path, options["delimiter"], options["x_field"], options["y_field"], detect_types,
+                             engine=ENGINE_NATIVE, encoding=options.get("encoding") or "utf-8")
+    if not reader.is_valid():
+        return None
+
+    with phase(operation, "feature copy") as timing:
+        index = build_tile_index(reader, feedback, check_types=detect_types == "yes")
+        timing["bytes"] = reader.end_offset
+        if index is not None:
+            timing["rows"] = sum(len(offsets) for offsets in index[0].values())
+    if index is None:
+        return None
+
+    mem_layer = QgsVectorLayer(f"Point?crs={reader.crs()}", layer_name_for(file_path), "memory")
+    mem_layer.dataProvider().addAttributes(reader.fields())
+    mem_layer.updateFields()
+    # Indexed while still empty, tiles are then indexed as they are loaded
+    create_spatial_index(mem_layer)
+    set_source_properties(mem_layer, options["file_path"], options["delimiter"], options["x_field"], options["y_field"],
+                          detect_types, reader.encoding)
+    mem_layer.setCustomProperty('column_types', serialize(reader.column_types))
+    mem_layer.setCustomProperty(LAZY_PROPERTY, True)
+    return mem_layer, reader, index
+
+
+class LazyCsvLayer:
+    # Keeps only the tiles around the map view loaded in the memory layer.
+    # Committed edits are kept by a RowJournal keyed by the byte offset of the
+    # original row, so tiles can be unloaded without losing them and saving
+    # only has to stream the original file once.
+    #
+    # Saving patches the file, so its columns cannot change. `on_schema_edit`
+    # is called with the layer when a column is added, deleted or renamed in
+    # an edit session, so the user can be told to undo it before committing.
+    #
+    # `tiles` is None while the file is being indexed again, see reset().
+    def __init__(self, layer, reader, tiles, tile_size, on_schema_edit=None):
+        self.layer = layer
+        self.reader = reader
+        self.tiles = tiles
+        self.tile_size = tile_size
+        self.window_too_large = False
+        self.loaded = {}
+        self.journal = RowJournal(layer, {}, reader.x_field, reader.y_field)
+        self.on_schema_edit = on_schema_edit
+        layer.attributeAdded.connect(self._attributes_edited)
+        layer.attributeDeleted.connect(self._attributes_edited)
+        layer.attributeRenamed.connect(self._attributes_edited)
+
+    def disconnect(self):
+        self.journal.disconnect()
+        self.layer.attributeAdded.disconnect(self._attributes_edited)
+        self.layer.attributeDeleted.disconnect(self._attributes_edited)
+        self.layer.attributeRenamed.disconnect(self._attributes_edited)
+
+    def _attributes_edited(self, *args):
+        # Also emitted when such an edit is undone, which needs no warning
+        if self.on_schema_edit is not None and self.layer.fields().names() != self.reader.header:
+            self.on_schema_edit(self.layer)
+
+    def _wanted_tiles(self, extent):
+        rect = QgsRectangle(extent)
+        rect.grow(max(rect.width(), rect.height()) * settings.value("lazy_window_margin"))
+        x0, y0 = tile_of(rect.xMinimum(), rect.yMinimum(), self.tile_size)
+        x1, y1 = tile_of(rect.xMaximum(), rect.yMaximum(), self.tile_size)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) < len(self.tiles):
+            return {(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1) if (x, y) in self.tiles}
+        return {key for key in self.tiles if x0 <= key[0] <= x1 and y0 <= key[1] <= y1}
+
+    def update_window(self, extent):
+        # Loads the tiles around `extent` (in layer coordinates) and unloads the
+        # rest. Returns False when the window holds more rows than
+        # editable_csv/lazy_max_features, in which case nothing is loaded.
+        if self.tiles is None or self.layer.isEditable() or not self.journal.matches_layer():
+            # Features must not come and go under an open edit session, and
+            # rows of the file no longer fit a layer whose columns changed
+            return True
+
+        wanted = self._wanted_tiles(extent)
+        self.window_too_large = sum(len(self.tiles[tile]) for tile in wanted) > settings.value("lazy_max_features")
+        if self.window_too_large:
+            wanted = set()
+
+        provider = self.layer.dataProvider()
+        fid_offsets = self.journal.fid_offsets
+        for tile in set(self.loaded) - wanted:
+            fids = self.loaded.pop(tile)
+            self.layer.deselect(fids)
+            provider.deleteFeatures(fids)
+            for fid in fids:
+                fid_offsets.pop(fid, None)
+
+        tile_of_offset = {}
+        for tile in wanted - set(self.loaded):
+            self.loaded[tile] = []
+            for offset in self.tiles[tile]:
+                if offset not in self.journal.deleted:
+                    tile_of_offset[offset] = tile
+
+        if tile_of_offset:
+            offsets = []
+            features = []
+            for offset, row in self.reader.read_rows_at(tile_of_offset):
+                feature = self.reader.feature(self.journal.modified.get(offset, row))
+                if feature is not None:
+                    offsets.append(offset)
+                    features.append(feature)
+            ok, added = provider.addFeatures(features)
+            for offset, feature in zip(offsets, added):
+                fid_offsets[feature.id()] = offset
+                self.loaded[tile_of_offset[offset]].append(feature.id())
+
+        self.layer.updateExtents()
+        self.layer.triggerRepaint()
+        return not self.window_too_large
+
+    def save(self, file_path):
+        # Streams the original file, applying the journal, and appends the
+        # features added in QGIS. Only committed edits are written. Saving over
+        # the original file resets the layer, which then has to be indexed
+        # again.
+        if not self.journal.matches_layer():
+            raise ValueError("columns were added, deleted or renamed, which layers that only load features around the map "
+                             "view cannot save. Reload the layer to go back to the columns of its file.")
+        self.journal.save(self.reader.file_path, file_path, self.reader.delimiter, self.reader.encoding)
+        if os.path.abspath(file_path) == os.path.abspath(self.reader.file_path):
+            # The tile index still points at the old offsets
+            self.reset()
+
+    def reset(self):
+        # Drops every loaded feature and committed edit, the column changes
+        # that kept the layer from being saved, and the tile index. The file
+        # is indexed again off the GUI thread by a TileIndexTask on
+        # self.reader, whose result goes to set_index().
+        fids = [fid for fid, _ in self.journal.fid_offsets.items()] + list(self.journal.added)
+        provider = self.layer.dataProvider()
+        self.layer.deselect(fids)
+        provider.deleteFeatures(fids)
+        self.loaded = {}
+        if not self.journal.matches_layer():
+            provider.deleteAttributes(list(range(self.layer.fields().count())))
+            provider.addAttributes(self.reader.fields())
+            self.layer.updateFields()
+        self.journal.disconnect()
+        self.journal = RowJournal(self.layer, {}, self.reader.x_field, self.reader.y_field)
+        self.reader = NativeReader(self.reader.file_path, self.reader.delimiter, self.reader.x_field, self.reader.y_field,
+                                   self.reader.encoding, column_types=self.reader.column_types)
+        self.tiles = None
+
+    def set_index(self, tiles, tile_size):
+        self.tiles = tiles
+        self.tile_size = tile_size
@@ -0,0 +1,124 @@
+import os.path
+
+from qgis.core import QgsProject
+from PyQt5.QtCore import QFileSystemWatcher, QObject, QTimer
+
+from . import row_journal, settings
+from .compressed_io import compression_of
+from .csv_reader import (NativeReader, file_head_checksum, file_tail_checksum, record_parsed_position, source_delimiter,
+                         source_encoding)
+from .layer_state import MODIFIED_PROPERTY, set_modified
+from .type_inference import TypeMismatch, deserialize
+
+LIVE_REFRESH_PROPERTY = 'live_refresh'
+
+
+def append_new_rows(layer, chunk_size):
+    # Adds the rows appended to the layer's file since it was last parsed.
+    # Returns the number of rows added, or None when the file was truncated or
+    # rewritten and only a full reload can bring the layer up to date, which
+    # is always the case for compressed files.
+    file_path = layer.customProperty('original_file_path')
+    if compression_of(file_path):
+        return None
+    offset = int(layer.customProperty('parsed_offset', 0) or 0)
+    size = os.path.getsize(file_path)
+    # A rewrite that keeps the start of the file and does not shrink it
+    # still changes the bytes just before the old end, in all likelihood
+    if (size < offset or file_head_checksum(file_path, offset) != int(layer.customProperty('parsed_head_checksum', -1))
+            or file_tail_checksum(file_path, offset) != int(layer.customProperty('parsed_tail_checksum', -1))):
+        return None
+    if size == offset:
+        return 0
+
+    reader = NativeReader(file_path, source_delimiter(layer),
+                          layer.customProperty('original_x_field'), layer.customProperty('original_y_field'),
+                          source_encoding(layer), column_types=deserialize(layer.customProperty('column_types')))
+    if [f.name() for f in reader.fields()] != [f.name() for f in layer.fields()]:
+        return None
+
+    # Read everything first, so a value that does not fit its column's type
+    # leaves the layer untouched for the full reload
+    try:
+        chunks = list(reader.feature_chunks(chunk_size, start_offset=offset))
+    except TypeMismatch:
+        return None
+
+    # The new features are not in the change journal, so later saves write
+    # the whole layer
+    row_journal.detach(layer.id())
+
+    # Rows that came from the file do not make the layer differ from it
+    was_modified = layer.customProperty(MODIFIED_PROPERTY, False)
+    count = 0
+    for chunk in chunks:
+        layer.startEditing()
+        layer.addFeatures(chunk)
+        layer.commitChanges()
+        count += len(chunk)
+    set_modified(layer, was_modified in (True, 'true'))
+    record_parsed_position(layer, file_path, reader.end_offset)
+    return count
+
+
+class LiveRefreshWatcher(QObject):
+    # Watches the files of layers in live mode and appends new rows to them.
+    # Changes are coalesced so each file is refreshed at most once per
+    # editable_csv/live_refresh_interval_ms.
+    def __init__(self, full_reload, parent=None):
+        super().__init__(parent)
+        self.full_reload = full_reload
+        self._layer_ids = {}
+        self._timers = {}
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.fileChanged.connect(self._file_changed)
+
+    def is_watched(self, layer):
+        return layer.id() in self._layer_ids.get(layer.customProperty('original_file_path'), ())
+
+    def watch(self, layer):
+        file_path = layer.customProperty('original_file_path')
+        self._layer_ids.setdefault(file_path, set()).add(layer.id())
+        if file_path not in self._watcher.files():
+            self._watcher.addPath(file_path)
+
+    def unwatch(self, layer_ids):
+        for file_path, watched in list(self._layer_ids.items()):
+            watched.difference_update(layer_ids)
+            if not watched:
+                del self._layer_ids[file_path]
+                self._watcher.removePath(file_path)
+                timer = self._timers.pop(file_path, None)
+                if timer is not None:
+                    timer.stop()
+
+    def _file_changed(self, file_path):
+        # Files replaced by a rename drop out of the watcher
+        if file_path not in self._watcher.files() and os.path.exists(file_path):
+            self._watcher.addPath(file_path)
+
+        timer = self._timers.get(file_path)
+        if timer is None:
+            timer = QTimer(self)
+            timer.setSingleShot(True)
+            timer.timeout.connect(lambda file_path=file_path: self._refresh(file_path))
+            self._timers[file_path] = timer
+        if not timer.isActive():
+            timer.start(settings.value("live_refresh_interval_ms"))
+
+    def _refresh(self, file_path):
+        if not os.path.exists(file_path):
+            return
+        chunk_size = settings.value("import_chunk_size")
+        for layer_id in list(self._layer_ids.get(file_path, ())):
+            layer = QgsProject.instance().mapLayer(layer_id)
+            if layer is None:
+                continue
+            if layer.isEditable():
+                # Try again once the user has finished editing
+                self._timers[file_path].start(settings.value("live_refresh_interval_ms"))
+                continue
+            if append_new_rows(layer, chunk_size) is None:
+                self.full_reload(layer)
+            else:
+                layer.triggerRepaint()
@@ -0,0 +1,174 @@
+import os
+from array import array
+
+from qgis.core import NULL, QgsFeatureRequest
+
+from .csv_patch import write_patched_csv
+from .csv_writer import value_formatters
+
+
+class FidOffsets:
+    # fid -> byte offset of the record a feature was read from. The memory
+    # provider hands out increasing fids, so a flat array indexed from the
+    # first fid is much smaller than a dict for millions of rows.
+    def __init__(self):
+        self.base = None
+        self.offsets = array('q')
+
+    def __setitem__(self, fid, offset):
+        if self.base is None:
+            self.base = fid
+        index = fid - self.base
+        if index < 0:
+            raise KeyError(fid)
+        if index >= len(self.offsets):
+            self.offsets.extend([-1] * (index - len(self.offsets)))
+            self.offsets.append(offset)
+        else:
+            self.offsets[index] = offset
+
+    def get(self, fid, default=None):
+        if self.base is None:
+            return default
+        index = fid - self.base
+        if 0 <= index < len(self.offsets) and self.offsets[index] >= 0:
+            return self.offsets[index]
+        return default
+
+    def pop(self, fid, default=None):
+        offset = self.get(fid)
+        if offset is None:
+            return default
+        self.offsets[fid - self.base] = -1
+        return offset
+
+    def clear(self):
+        self.base = None
+        self.offsets = array('q')
+
+    def items(self):
+        base = self.base
+        return ((base + index, offset) for index, offset in enumerate(self.offsets) if offset >= 0)
+
+
+class RowJournal:
+    # Records the committed edits of a layer against the records of the CSV
+    # it was read from, so a save can patch that file instead of writing
+    # every feature again.
+    def __init__(self, layer, fid_offsets, x_field, y_field):
+        self.layer = layer
+        self.fid_offsets = fid_offsets
+        self.deleted = set()
+        self.modified = {}
+        self.added = set()
+        # Patching copies the file's header, so the recorded rows are only
+        # usable while the layer still has these columns
+        self.field_names = layer.fields().names()
+        self.schema_changed = False
+        names = self.field_names
+        self._x_index = names.index(x_field) if x_field in names else -1
+        self._y_index = names.index(y_field) if y_field in names else -1
+        self._formatters = value_formatters(layer.fields())
+
+        layer.committedFeaturesAdded.connect(self._features_added)
+        layer.committedFeaturesRemoved.connect(self._features_removed)
+        layer.committedAttributeValuesChanges.connect(self._features_changed)
+        layer.committedGeometriesChanges.connect(self._features_changed)
+        layer.committedAttributesAdded.connect(self._attributes_changed)
+        layer.committedAttributesDeleted.connect(self._attributes_changed)
+
+    def disconnect(self):
+        self.layer.committedFeaturesAdded.disconnect(self._features_added)
+        self.layer.committedFeaturesRemoved.disconnect(self._features_removed)
+        self.layer.committedAttributeValuesChanges.disconnect(self._features_changed)
+        self.layer.committedGeometriesChanges.disconnect(self._features_changed)
+        self.layer.committedAttributesAdded.disconnect(self._attributes_changed)
+        self.layer.committedAttributesDeleted.disconnect(self._attributes_changed)
+
+    def matches_layer(self):
+        # False once columns were added or deleted, and while any is renamed:
+        # the rows recorded since no longer line up with the file's header
+        return not self.schema_changed and self.layer.fields().names() == self.field_names
+
+    def row_for(self, feature):
+        row = ['' if value == NULL else value for value in feature.attributes()]
+        for i, format_value in self._formatters:
+            row[i] = format_value(row[i])
+        geometry = feature.geometry()
+        if not geometry.isNull():
+            point = geometry.asPoint()
+            if self._x_index >= 0:
+                row[self._x_index] = point.x()
+            if self._y_index >= 0:
+                row[self._y_index] = point.y()
+        return row
+
+    def _features_added(self, layer_id, features):
+        self.added.update(feature.id() for feature in features)
+
+    def _features_removed(self, layer_id, fids):
+        for fid in fids:
+            offset = self.fid_offsets.pop(fid, None)
+            if offset is None:
+                self.added.discard(fid)
+            else:
+                self.deleted.add(offset)
+                self.modified.pop(offset, None)
+
+    def _attributes_changed(self, layer_id, attributes):
+        self.schema_changed = True
+
+    def _features_changed(self, layer_id, changes):
+        for fid in changes:
+            offset = self.fid_offsets.get(fid)
+            if offset is not None:
+                self.modified[offset] = self.row_for(self.layer.getFeature(fid))
+
+    def clear(self):
+        self.deleted = set()
+        self.modified = {}
+        self.added = set()
+
+    def save(self, source_path, file_path, delimiter, encoding="utf-8"):
+        # Patches `source_path` into `file_path`. When that overwrites the
+        # source, the journal follows the records to their new offsets and
+        # starts over with no pending changes. Raises ValueError when the
+        # layer's columns no longer match the file.
+        if not self.matches_layer():
+            raise ValueError("columns were added, deleted or renamed since the file was read, "
+                             "so its rows cannot be patched")
+        replacements = dict.fromkeys(self.deleted)
+        replacements.update(self.modified)
+        added = sorted(self.added)
+        request = QgsFeatureRequest().setFilterFids(added)
+        features = {feature.id(): feature for feature in self.layer.getFeatures(request)}
+        added = [fid for fid in added if fid in features]
+        result = write_patched_csv(source_path, file_path, replacements,
+                                   [self.row_for(features[fid]) for fid in added], delimiter, encoding)
+
+        if os.path.abspath(file_path) == os.path.abspath(source_path):
+            for fid, offset in self.fid_offsets.items():
+                self.fid_offsets[fid] = result.new_offset(offset)
+            for fid, offset in zip(added, result.appended):
+                self.fid_offsets[fid] = offset
+            self.clear()
+        return result
+
+
+_journals = {}
+
+
+def attach(layer, fid_offsets, x_field, y_field):
+    detach(layer.id())
+    _journals[layer.id()] = RowJournal(layer, fid_offsets, x_field, y_field)
+    return _journals[layer.id()]
+
+
+def detach(layer_id):
+    journal = _journals.pop(layer_id, None)
+    if journal is not None:
+        journal.disconnect()
+
+
+def journal_for(layer_id):
+    return _journals.get(layer_id)
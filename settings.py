@@ -0,0 +1,41 @@
+from qgis.core import QgsSettings
+
+SETTINGS_PREFIX = "editable_csv"
+
+DEFAULTS = {
+    "import_chunk_size": 50000,
+    "import_engine": "native",
+    "parallel_import": True,
+    "import_workers": 4,
+    "parallel_export": True,
+    "live_refresh_interval_ms": 2000,
+    "metadata_cache_entries": 64,
+    "lazy_threshold_mb": 1024,
+    "lazy_tiles_across": 1024,
+    "lazy_window_margin": 0.25,
+    "lazy_max_features": 2000000,
+    "delta_save": True,
+    "type_sample_rows": 10000,
+    "type_confidence": 1.0,
+    "delete_chunk_size": 50000,
+    "spatial_index": True,
+    "sidecar_cache": True,
+    "sidecar_dir": "",
+    "sidecar_max_mb": 2048,
+    "log_timings": True,
+    "timings_dir": "",
+    "profile_next_operation": False,
+}
+
+
+def value(key, value_type=None):
+    default = DEFAULTS.get(key)
+    if value_type is None and default is not None:
+        value_type = default.__class__
+    if value_type is None:
+        return QgsSettings().value(f"{SETTINGS_PREFIX}/{key}", default)
+    return QgsSettings().value(f"{SETTINGS_PREFIX}/{key}", default, type=value_type)
+
+
+def set_value(key, new_value):
+    QgsSettings().setValue(f"{SETTINGS_PREFIX}/{key}", new_value)
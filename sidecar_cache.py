@@ -0,0 +1,273 @@
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+from array import array
+from itertools import accumulate, chain
+
+from qgis.core import NULL, QgsApplication, QgsFeature, QgsFields, QgsGeometry, QgsPointXY
+from PyQt5.QtCore import QDate
+
+from . import settings
+from .type_inference import BOOLEAN, DATE, INTEGER, INTEGER64, REAL, qgs_field
+
+# A sidecar holds what the native reader produced for one CSV, column by
+# column: X/Y as float64, record offsets as int64, numbers and dates as
+# int64/float64 with a null mask, booleans as int8 and text as end offsets
+# into a UTF-8 blob. Layout: MAGIC, header length, JSON header, then the
+# column parts, each aligned to 8 bytes so they can be cast in place.
+MAGIC = b"ECSVSC01"
+SUFFIX = ".ecsv"
+_ALIGN = 8
+
+_NUMERIC_CODES = {INTEGER: 'q', INTEGER64: 'q', REAL: 'd', DATE: 'q'}
+
+
+def cache_dir():
+    return settings.value("sidecar_dir") or os.path.join(QgsApplication.qgisSettingsDirPath(), "editable_csv_cache")
+
+
+def sidecar_key(reader):
+    # Everything that changes what an import produces. A changed source file
+    # gives a different key, so stale sidecars are never found.
+    stat = os.stat(reader.file_path)
+    return {
+        "path": os.path.abspath(reader.file_path),
+        "mtime": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "delimiter": reader.delimiter,
+        "x_field": reader.x_field,
+        "y_field": reader.y_field,
+        "column_types": list(reader.column_types),
+        "encoding": reader.encoding,
+    }
+
+
+def sidecar_path(key):
+    digest = hashlib.sha1(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir(), digest + SUFFIX)
+
+
+def evict(keep=None):
+    # Removes the least recently used sidecars until the cache fits in
+    # editable_csv/sidecar_max_mb. Sidecars are touched when read.
+    limit = settings.value("sidecar_max_mb") * 1024 * 1024
+    entries = []
+    try:
+        names = os.listdir(cache_dir())
+    except OSError:
+        return
+    for name in names:
+        if not name.endswith(SUFFIX):
+            continue
+        path = os.path.join(cache_dir(), name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= limit:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+class SidecarWriter:
+    # Collects the imported features column by column into part files next
+    # to the cache, and joins them into one sidecar on commit.
+    def __init__(self, reader):
+        self.key = sidecar_key(reader)
+        self.path = sidecar_path(self.key)
+        self.header = list(reader.header)
+        self.column_types = list(reader.column_types)
+        self.x_index = reader.header.index(reader.x_field)
+        self.y_index = reader.header.index(reader.y_field)
+        os.makedirs(cache_dir(), exist_ok=True)
+        self.tmp_dir = tempfile.mkdtemp(dir=cache_dir())
+        self.parts = {}
+        self.string_sizes = {}
+        self.count = 0
+
+    def _write(self, name, data):
+        part = self.parts.get(name)
+        if part is None:
+            part = self.parts[name] = open(os.path.join(self.tmp_dir, name), "wb")
+        if isinstance(data, array):
+            data.tofile(part)
+        else:
+            part.write(data)
+
+    def add(self, features, offsets):
+        points = [feature.geometry().asPoint() for feature in features]
+        self._write("x", array('d', [point.x() for point in points]))
+        self._write("y", array('d', [point.y() for point in points]))
+        self._write("offsets", array('q', offsets))
+
+        columns = list(zip(*[feature.attributes() for feature in features]))
+        for i, column_type in enumerate(self.column_types):
+            values = columns[i] if columns else ()
+            if column_type in _NUMERIC_CODES:
+                mask = bytes(1 if value == NULL else 0 for value in values)
+                if column_type == DATE:
+                    values = [0 if value == NULL else value.toJulianDay() for value in values]
+                elif 1 in mask:
+                    values = [0 if value == NULL else value for value in values]
+                self._write(f"{i}.values", array(_NUMERIC_CODES[column_type], values))
+                self._write(f"{i}.mask", mask)
+            elif column_type == BOOLEAN:
+                self._write(f"{i}.values", array('b', [-1 if value == NULL else int(value) for value in values]))
+            else:
+                encoded = [('' if value == NULL else str(value)).encode("utf-8") for value in values]
+                base = self.string_sizes.get(i, 0)
+                ends = array('q', accumulate(chain([base], (len(data) for data in encoded))))[1:]
+                self.string_sizes[i] = ends[-1] if ends else base
+                self._write(f"{i}.ends", ends)
+                self._write(f"{i}.blob", b"".join(encoded))
+        self.count += len(features)
+
+    def commit(self, end_offset):
+        for part in self.parts.values():
+            part.close()
+        layout = {}
+        position = 0
+        for name in sorted(self.parts):
+            size = os.path.getsize(os.path.join(self.tmp_dir, name))
+            layout[name] = [position, size]
+            position += size + (-size % _ALIGN)
+        header = json.dumps({
+            "key": self.key,
+            "header": self.header,
+            "count": self.count,
+            "end_offset": end_offset,
+            "parts": layout,
+        }).encode("utf-8")
+        header += b" " * (-(len(MAGIC) + 8 + len(header)) % _ALIGN)
+
+        tmp_path = os.path.join(self.tmp_dir, "sidecar")
+        with open(tmp_path, "wb") as out:
+            out.write(MAGIC)
+            out.write(struct.pack("<Q", len(header)))
+            out.write(header)
+            for name in sorted(self.parts):
+                with open(os.path.join(self.tmp_dir, name), "rb") as part:
+                    shutil.copyfileobj(part, out)
+                out.write(b"\0" * (-layout[name][1] % _ALIGN))
+        os.replace(tmp_path, self.path)
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        evict(keep=self.path)
+
+    def discard(self):
+        for part in self.parts.values():
+            part.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+class SidecarReader:
+    # Reader engine over a memory-mapped sidecar. It offers the same interface
+    # as NativeReader for import and reload, without touching the CSV text.
+    engine = "native"
+
+    def __init__(self, path, reader, meta):
+        self.path = path
+        self.file_path = reader.file_path
+        self.delimiter = reader.delimiter
+        self.x_field = reader.x_field
+        self.y_field = reader.y_field
+        self.encoding = reader.encoding
+        self.header = meta["header"]
+        self.column_types = meta["key"]["column_types"]
+        self.count = meta["count"]
+        self.end_offset = meta["end_offset"]
+        self.fraction = 0.0
+        self.chunk_offsets = []
+        self._parts = meta["parts"]
+        self._data_start = meta["data_start"]
+        self._fields = QgsFields()
+        for name, column_type in zip(self.header, self.column_types):
+            self._fields.append(qgs_field(name, column_type))
+        self._crs = reader.crs()
+
+    def is_valid(self):
+        return True
+
+    def fields(self):
+        return self._fields
+
+    def crs(self):
+        return self._crs
+
+    def _slice(self, mm, name, code, lo, hi):
+        # Items lo..hi of a column part; only this range is paged in
+        start = self._data_start + self._parts[name][0]
+        if code is None:
+            return mm[start + lo:start + hi]
+        values = array(code)
+        values.frombytes(mm[start + lo * values.itemsize:start + hi * values.itemsize])
+        return values
+
+    def feature_chunks(self, chunk_size):
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            fields = self._fields
+            for lo in range(0, self.count, chunk_size):
+                hi = min(lo + chunk_size, self.count)
+                values = [self._column_values(mm, i, column_type, lo, hi)
+                          for i, column_type in enumerate(self.column_types)]
+
+                chunk = []
+                xs = self._slice(mm, "x", 'd', lo, hi)
+                ys = self._slice(mm, "y", 'd', lo, hi)
+                for x, y, attributes in zip(xs, ys, zip(*values)):
+                    feature = QgsFeature(fields)
+                    feature.setAttributes(list(attributes))
+                    feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(x, y)))
+                    chunk.append(feature)
+                self.chunk_offsets = self._slice(mm, "offsets", 'q', lo, hi).tolist()
+                self.fraction = hi / self.count
+                yield chunk
+
+    def _column_values(self, mm, i, column_type, lo, hi):
+        if column_type in _NUMERIC_CODES:
+            column = self._slice(mm, f"{i}.values", _NUMERIC_CODES[column_type], lo, hi).tolist()
+            if column_type == DATE:
+                column = [QDate.fromJulianDay(day) for day in column]
+            mask = self._slice(mm, f"{i}.mask", None, lo, hi)
+            if 1 in mask:
+                column = [NULL if null else value for value, null in zip(column, mask)]
+            return column
+        if column_type == BOOLEAN:
+            return [NULL if value < 0 else bool(value) for value in self._slice(mm, f"{i}.values", 'b', lo, hi)]
+
+        ends = self._slice(mm, f"{i}.ends", 'q', max(lo - 1, 0), hi).tolist()
+        base = ends.pop(0) if lo else 0
+        blob = self._slice(mm, f"{i}.blob", None, base, ends[-1] if ends else base)
+        starts = [base] + ends[:-1]
+        return [str(blob[start - base:end - base], "utf-8") for start, end in zip(starts, ends)]
+
+
+def open_sidecar(reader):
+    # Returns a SidecarReader for `reader`'s file if a valid sidecar exists
+    path = sidecar_path(sidecar_key(reader))
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return None
+            (length,) = struct.unpack("<Q", f.read(8))
+            meta = json.loads(f.read(length).decode("utf-8"))
+    except (OSError, ValueError, struct.error):
+        return None
+    if meta.get("key") != sidecar_key(reader) or meta.get("header") != list(reader.header):
+        return None
+    meta["data_start"] = len(MAGIC) + 8 + length
+    # Mark it as recently used for eviction
+    os.utime(path)
+    return SidecarReader(path, reader, meta)
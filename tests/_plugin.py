@@ -0,0 +1,27 @@
+import importlib
+import os
+import sys
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_plugin_module(name):
+    # The plugin is a package named after its folder, so import it that way
+    # to keep the relative imports inside it working.
+    parent, package = os.path.split(PLUGIN_DIR)
+    if parent not in sys.path:
+        sys.path.insert(0, parent)
+    return importlib.import_module(f"{package}.{name}")
+
+
+_qgs_app = None
+
+
+def start_qgis():
+    # One QgsApplication without a GUI for the whole test run
+    global _qgs_app
+    if _qgs_app is None:
+        from qgis.core import QgsApplication
+        _qgs_app = QgsApplication([], False)
+        _qgs_app.initQgis()
+    return _qgs_app
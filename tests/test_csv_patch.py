@@ -0,0 +1,96 @@
+import os
+
+import pytest
+
+from _plugin import load_plugin_module
+
+csv_patch = load_plugin_module("csv_patch")
+
+
+def _write(tmp_path, data, name="source.csv"):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def _offsets(data):
+    # Byte offset of every line of `data`
+    offsets = [0]
+    for line in data.splitlines(keepends=True)[:-1]:
+        offsets.append(offsets[-1] + len(line))
+    return offsets
+
+
+SOURCE = b"x,y,name\n1.0,2.0,a\n3.0,4.0,b\n5.0,6.0,c\n"
+
+
+def test_replace_delete_and_append(tmp_path):
+    source = _write(tmp_path, SOURCE)
+    out = str(tmp_path / "out.csv")
+    header, a, b, c = _offsets(SOURCE)
+    result = csv_patch.write_patched_csv(source, out, {a: None, b: [30.0, 40.0, "b2"]}, [[7.0, 8.0, "d"]], ",")
+
+    expected = b"x,y,name\n30.0,40.0,b2\n5.0,6.0,c\n7.0,8.0,d\n"
+    with open(out, "rb") as f:
+        assert f.read() == expected
+    assert result.replaced == {b: expected.index(b"30.0")}
+    assert result.new_offset(c) == expected.index(b"5.0")
+    assert result.appended == [expected.index(b"7.0")]
+
+
+def test_untouched_bytes_are_copied_verbatim(tmp_path):
+    data = b'x;y;note\r\n1;2;"two\r\nlines"\r\n3;4;plain\r\n'
+    source = _write(tmp_path, data)
+    out = str(tmp_path / "out.csv")
+    quoted = data.index(b"1;2")
+    result = csv_patch.write_patched_csv(source, out, {quoted: [1, 2, "one line"]}, [], ";")
+
+    with open(out, "rb") as f:
+        assert f.read() == b"x;y;note\r\n1;2;one line\r\n3;4;plain\r\n"
+    assert result.new_offset(data.index(b"3;4")) == len(b"x;y;note\r\n1;2;one line\r\n")
+
+
+def test_append_after_missing_final_newline(tmp_path):
+    source = _write(tmp_path, b"x,y\n1,2")
+    out = str(tmp_path / "out.csv")
+    result = csv_patch.write_patched_csv(source, out, {}, [[3, 4]], ",")
+
+    with open(out, "rb") as f:
+        assert f.read() == b"x,y\n1,2\n3,4\n"
+    assert result.appended == [len(b"x,y\n1,2\n")]
+
+
+def test_patch_in_place_keeps_no_temporary_file(tmp_path):
+    source = _write(tmp_path, SOURCE)
+    b = _offsets(SOURCE)[2]
+    csv_patch.write_patched_csv(source, source, {b: [0.0, 0.0, "z"]}, [], ",")
+
+    with open(source, "rb") as f:
+        assert f.read() == b"x,y,name\n1.0,2.0,a\n0.0,0.0,z\n5.0,6.0,c\n"
+    assert os.listdir(tmp_path) == ["source.csv"]
+
+
+def test_copy_range_resumes_after_sendfile_fails(tmp_path, monkeypatch):
+    data = bytes(range(256)) * 64
+    source = _write(tmp_path, data)
+    real_sendfile = os.sendfile
+    calls = []
+
+    def flaky_sendfile(out_fd, in_fd, offset, count):
+        calls.append(offset)
+        if len(calls) > 1:
+            raise OSError("sendfile not supported here")
+        return real_sendfile(out_fd, in_fd, offset, min(count, 1000))
+
+    monkeypatch.setattr(os, "sendfile", flaky_sendfile, raising=False)
+    with open(source, "rb") as src, open(tmp_path / "out", "wb", buffering=0) as out:
+        assert csv_patch._copy_range(src, out, 100, 5000) == 4900
+    assert (tmp_path / "out").read_bytes() == data[100:5000]
+
+
+def test_copy_range_fails_when_the_source_is_short(tmp_path, monkeypatch):
+    source = _write(tmp_path, b"0123456789")
+    monkeypatch.setattr(os, "sendfile", lambda out_fd, in_fd, offset, count: 0, raising=False)
+    with open(source, "rb") as src, open(tmp_path / "out", "wb", buffering=0) as out:
+        with pytest.raises(EOFError):
+            csv_patch._copy_range(src, out, 5, 20)
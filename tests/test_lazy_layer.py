@@ -0,0 +1,40 @@
+import random
+from math import floor
+
+import pytest
+
+pytest.importorskip("qgis.core")
+
+from _plugin import load_plugin_module, start_qgis  # noqa: E402
+
+
+def _index(tmp_path, points):
+    start_qgis()
+    csv_reader = load_plugin_module("csv_reader")
+    lazy_layer = load_plugin_module("lazy_layer")
+    path = tmp_path / "points.csv"
+    path.write_text("x,y,name\n" + "".join(f"{x!r},{y!r},p{i}\n" for i, (x, y) in enumerate(points)))
+    reader = csv_reader.NativeReader(str(path), ",", "x", "y")
+    tiles, tile_size = lazy_layer.build_tile_index(reader)
+    rows = {offset: row for offset, row in reader.iter_rows()}
+    return tiles, tile_size, rows
+
+
+@pytest.mark.parametrize("scale", [1e-4, 1.0, 1e6])
+def test_tile_size_follows_the_extent(tmp_path, scale):
+    rng = random.Random(1)
+    points = [(rng.uniform(-5, 5) * scale, rng.uniform(-5, 5) * scale) for _ in range(2000)]
+    tiles, tile_size, rows = _index(tmp_path, points)
+
+    extent = max(max(p[i] for p in points) - min(p[i] for p in points) for i in (0, 1))
+    assert extent / 1024 <= tile_size < 4 * extent / 1024
+    assert sum(len(offsets) for offsets in tiles.values()) == len(points)
+    for (tx, ty), offsets in tiles.items():
+        for offset in offsets:
+            x, y = float(rows[offset][0]), float(rows[offset][1])
+            assert (floor(x / tile_size), floor(y / tile_size)) == (tx, ty)
+
+
+def test_identical_points_share_one_tile(tmp_path):
+    tiles, _, _ = _index(tmp_path, [(500000.0, 4000000.0)] * 3)
+    assert len(tiles) == 1
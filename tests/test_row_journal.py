@@ -0,0 +1,87 @@
+import pytest
+
+pytest.importorskip("qgis.core")
+
+from qgis.core import QgsField, QgsGeometry, QgsPointXY  # noqa: E402
+from PyQt5.QtCore import QVariant  # noqa: E402
+
+from _plugin import load_plugin_module, start_qgis  # noqa: E402
+
+SOURCE = "x,y,name\n1.0,2.0,a\n3.0,4.0,b\n5.0,6.0,c\n"
+
+
+@pytest.fixture
+def layer(tmp_path):
+    start_qgis()
+    csv_reader = load_plugin_module("csv_reader")
+    row_journal = load_plugin_module("row_journal")
+    path = tmp_path / "points.csv"
+    path.write_text(SOURCE)
+    fid_offsets = row_journal.FidOffsets()
+    options = {"file_path": str(path), "delimiter": ",", "x_field": "x", "y_field": "y", "detect_types": False}
+    layer = csv_reader.build_memory_layer(options, 2, fid_offsets=fid_offsets, use_sidecars=False)
+    journal = row_journal.attach(layer, fid_offsets, "x", "y")
+    yield layer, journal, str(path)
+    row_journal.detach(layer.id())
+
+
+def _feature_named(layer, name):
+    return next(feature for feature in layer.getFeatures() if feature["name"] == name)
+
+
+def _patch(journal, path):
+    journal.save(path, path, ",")
+    with open(path) as f:
+        return f.read()
+
+
+def test_committed_edits_are_patched_into_the_file(layer):
+    layer, journal, path = layer
+    layer.startEditing()
+    layer.changeAttributeValue(_feature_named(layer, "b").id(), layer.fields().indexOf("name"), "B")
+    layer.changeGeometry(_feature_named(layer, "c").id(), QgsGeometry.fromPointXY(QgsPointXY(7, 8)))
+    layer.deleteFeature(_feature_named(layer, "a").id())
+    assert layer.commitChanges()
+
+    assert journal.matches_layer()
+    assert _patch(journal, path) == "x,y,name\n3.0,4.0,B\n7.0,8.0,c\n"
+
+
+def test_added_column_stops_delta_saves(layer):
+    layer, journal, path = layer
+    layer.startEditing()
+    layer.addAttribute(QgsField("extra", QVariant.String))
+    assert layer.commitChanges()
+    layer.startEditing()
+    layer.changeAttributeValue(_feature_named(layer, "b").id(), layer.fields().indexOf("extra"), "value")
+    assert layer.commitChanges()
+
+    assert not journal.matches_layer()
+    with pytest.raises(ValueError):
+        journal.save(path, path, ",")
+    with open(path) as f:
+        assert f.read() == SOURCE
+
+
+def test_deleted_column_stops_delta_saves(layer):
+    layer, journal, _ = layer
+    layer.startEditing()
+    layer.deleteAttribute(layer.fields().indexOf("name"))
+    assert layer.commitChanges()
+
+    assert not journal.matches_layer()
+    assert not load_plugin_module("core").can_patch_source(layer)
+
+
+def test_renamed_column_stops_delta_saves_until_renamed_back(layer):
+    layer, journal, _ = layer
+    index = layer.fields().indexOf("name")
+    layer.startEditing()
+    layer.renameAttribute(index, "label")
+    assert layer.commitChanges()
+    assert not journal.matches_layer()
+
+    layer.startEditing()
+    layer.renameAttribute(index, "name")
+    assert layer.commitChanges()
+    assert journal.matches_layer()
@@ -0,0 +1,142 @@
+import re
+
+from qgis.core import NULL, QgsField
+from PyQt5.QtCore import QDate, Qt, QVariant
+
+from . import settings
+
+STRING = 'string'
+INTEGER = 'integer'
+INTEGER64 = 'integer64'
+REAL = 'real'
+BOOLEAN = 'boolean'
+DATE = 'date'
+
+# Only values the exporters write back unchanged are typed: no leading zeros
+# or plus signs (codes such as "007" stay text) and booleans spelled the way
+# they are written, true/false.
+_INTEGER_RE = re.compile(r"0|-?[1-9]\d*")
+_REAL_RE = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?")
+_BOOLEAN_RE = re.compile(r"true|false")
+_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+_INT32_MAX = 2 ** 31 - 1
+_INT64_MAX = 2 ** 63 - 1
+
+VARIANT_TYPES = {
+    STRING: QVariant.String,
+    INTEGER: QVariant.Int,
+    INTEGER64: QVariant.LongLong,
+    REAL: QVariant.Double,
+    BOOLEAN: QVariant.Bool,
+    DATE: QVariant.Date,
+}
+
+
+def _share(pattern, values):
+    # filter() with a compiled fullmatch runs the whole column in C
+    return sum(1 for _ in filter(pattern.fullmatch, values)) / len(values)
+
+
+def infer_column_type(values, threshold):
+    # `values` are the non-empty sampled strings of one column. A type is
+    # picked when at least `threshold` of them parse as it.
+    if not values:
+        return STRING
+    if _share(_INTEGER_RE, values) >= threshold:
+        largest = max(abs(int(v)) for v in filter(_INTEGER_RE.fullmatch, values))
+        if largest > _INT64_MAX:
+            return STRING
+        return INTEGER64 if largest > _INT32_MAX else INTEGER
+    if _share(_REAL_RE, values) >= threshold:
+        return REAL
+    if _share(_BOOLEAN_RE, values) >= threshold:
+        return BOOLEAN
+    if _share(_DATE_RE, values) >= threshold:
+        return DATE
+    return STRING
+
+
+def infer_column_types(rows, width, threshold=None):
+    if threshold is None:
+        threshold = settings.value("type_confidence")
+    columns = [[] for _ in range(width)]
+    for row in rows:
+        for i, value in enumerate(row[:width]):
+            if value:
+                columns[i].append(value)
+    return [infer_column_type(values, threshold) for values in columns]
+
+
+def qgs_field(name, column_type):
+    return QgsField(name, VARIANT_TYPES.get(column_type, QVariant.String))
+
+
+class TypeMismatch(ValueError):
+    # A value that does not parse as the type inferred for its column, which
+    # then has to be read as text
+    def __init__(self, name, column, column_type, value):
+        super().__init__(f"Column '{name}' holds {value!r}, which is not {column_type}")
+        self.name = name
+        self.column = column
+
+
+# Converters take the raw text, or an already typed value from an edited
+# row. They return NULL for empty cells and raise ValueError for text that
+# does not parse.
+def _converter(parse):
+    def convert(value):
+        if value is None or value == '':
+            return NULL
+        return parse(value) if isinstance(value, str) else value
+    return convert
+
+
+def _parse_int(limit):
+    def parse(value):
+        if not _INTEGER_RE.fullmatch(value) or abs(int(value)) > limit:
+            raise ValueError(value)
+        return int(value)
+    return parse
+
+
+def _parse_real(value):
+    if not _REAL_RE.fullmatch(value):
+        raise ValueError(value)
+    return float(value)
+
+
+def _parse_bool(value):
+    if value == 'true':
+        return True
+    if value == 'false':
+        return False
+    raise ValueError(value)
+
+
+def _parse_date(value):
+    date = QDate.fromString(value, Qt.ISODate) if _DATE_RE.fullmatch(value) else QDate()
+    if not date.isValid():
+        raise ValueError(value)
+    return date
+
+
+_CONVERTERS = {
+    INTEGER: _converter(_parse_int(_INT32_MAX)),
+    INTEGER64: _converter(_parse_int(_INT64_MAX)),
+    REAL: _converter(_parse_real),
+    BOOLEAN: _converter(_parse_bool),
+    DATE: _converter(_parse_date),
+}
+
+
+def converters(column_types):
+    # (column index, converter) for every non-text column
+    return [(i, _CONVERTERS[column_type]) for i, column_type in enumerate(column_types) if column_type in _CONVERTERS]
+
+
+def serialize(column_types):
+    return ",".join(column_types)
+
+
+def deserialize(value):
+    return value.split(",") if value else None